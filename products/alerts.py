@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import CharField, DateTimeField, F, IntegerField, Q, Value
+from django.utils import timezone
+
+from products.maintenance import chunked
+from products.models import AlertDelivery, AlertRule
+
+# Current and highest price are read from the PriceSummary joined to the rule.
+CURRENT_PRICE = 'product__summary__current_price'
+CROSSED = (
+    Q(kind=AlertRule.BELOW, **{f'{CURRENT_PRICE}__lte': F('threshold')})
+    | Q(kind=AlertRule.DROP, **{
+        f'{CURRENT_PRICE}__lte': F('product__summary__max_price') * (Value(1.0) - F('threshold') / Value(100.0)),
+    })
+)
+
+
+def _queue_deliveries(rules):
+    """
+    Inserts an outbox entry for every rule of the queryset with one
+    INSERT ... SELECT, so fired rules never pass through Python.
+    :return: number of inserted rows
+    """
+    select = rules.annotate(
+        queued_at=Value(timezone.now(), output_field=DateTimeField()),
+        no_attempts=Value(0, output_field=IntegerField()),
+        no_error=Value('', output_field=CharField()),
+    ).values_list('id', 'product_id', CURRENT_PRICE, 'queued_at', 'no_attempts', 'no_error')
+    sql, params = select.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {AlertDelivery._meta.db_table} (rule_id, product_id, price, created_at, attempts, error) '
+            f'{sql}',
+            params,
+        )
+        return cursor.rowcount
+
+
+def evaluate_alerts(product_ids, batch_size=5000):
+    """
+    Fires the alert rules of products whose price crossed the threshold and
+    re-arms the rules whose price is back above it.
+
+    Rules are matched against the price summaries with one joined query per
+    batch of products, so the cost does not depend on the length of the
+    history. A fired rule stays triggered until its condition no longer
+    holds, which makes every crossing fire exactly once.
+    :param product_ids: ids of products that got new observations
+    :param batch_size: products evaluated per query
+    :return: number of queued AlertDelivery
+    """
+    fired = 0
+    for batch in chunked(product_ids, batch_size):
+        rules = AlertRule.objects.filter(product_id__in=batch, active=True)
+        crossed = rules.filter(CROSSED, triggered=False)
+        with transaction.atomic():
+            fired += _queue_deliveries(crossed)
+            crossed.update(triggered=True)
+            rules.filter(triggered=True).exclude(CROSSED).update(triggered=False)
+    return fired
+
+
+def _message(delivery):
+    rule, product = delivery.rule, delivery.product
+    if rule.kind == AlertRule.BELOW:
+        reason = f'is now €{delivery.price:.2f}, at or below your target of €{rule.threshold:.2f}'
+    else:
+        reason = f'is now €{delivery.price:.2f}, {rule.threshold:g}% or more below its highest price'
+    return EmailMessage(
+        subject=f'Price alert: {product.name}',
+        body=f'{product.name} {reason}.\n\n{product.product_url}\n',
+        to=[rule.email],
+    )
+
+
+def deliver_alerts(batch_size=100, report=None):
+    """
+    Sends the pending outbox entries by email, oldest first, over one SMTP
+    connection per batch. Failed entries are retried on the next run until
+    they reached ALERT_MAX_ATTEMPTS.
+    :param batch_size: entries sent per batch
+    :param report: optional callable(sent, failed) invoked after every batch
+    :return: tuple (sent, failed)
+    """
+    max_attempts = getattr(settings, 'ALERT_MAX_ATTEMPTS', 5)
+    pending = (
+        AlertDelivery.objects
+        .filter(delivered_at__isnull=True, attempts__lt=max_attempts)
+        .select_related('rule', 'product')
+        .order_by('id')
+    )
+    sent = failed = 0
+    last_id = 0
+
+    while True:
+        batch = list(pending.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return sent, failed
+        last_id = batch[-1].pk
+
+        with get_connection() as mail:
+            for delivery in batch:
+                delivery.attempts += 1
+                try:
+                    mail.send_messages([_message(delivery)])
+                except Exception as e:
+                    delivery.error = str(e)
+                    failed += 1
+                else:
+                    delivery.delivered_at = timezone.now()
+                    delivery.error = ''
+                    sent += 1
+
+        AlertDelivery.objects.bulk_update(batch, ['attempts', 'delivered_at', 'error'])
+        if report is not None:
+            report(sent, failed)
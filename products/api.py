@@ -0,0 +1,241 @@
+import base64
+import binascii
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from products.alerts import evaluate_alerts
+from products.caching import catalog_page
+from products.forms import AlertRuleForm, ProductUrlForm
+from products.jobs import ADD_PRODUCTS, enqueue_job
+from products.maintenance import chunked, delete_products
+from products.models import AlertRule, PriceHistory, Product
+
+PRODUCT_FIELDS = (
+    'id', 'name', 'price', 'photo_url', 'product_url', 'supplier', 'supplier_url', 'timestamp',
+    'current_price', 'min_price', 'max_price', 'first_added', 'last_added',
+)
+HISTORY_FIELDS = ('id', 'timestamp', 'price')
+
+
+class ApiError(Exception):
+    """Invalid API request, answered with status 400 and the message."""
+
+
+def _encode_cursor(row):
+    value = json.dumps([row['timestamp'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        timestamp, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp, pk = parse_datetime(timestamp), int(pk)
+    except (ValueError, TypeError, binascii.Error):
+        timestamp = None
+    if timestamp is None:
+        raise ApiError('invalid cursor')
+    return timestamp, pk
+
+
+def _datetime_param(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        # Well-formed but out of range values, such as month 13, raise ValueError.
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ApiError(f'{name} must be an ISO 8601 datetime')
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _limit_param(request):
+    try:
+        limit = int(request.GET.get('limit', getattr(settings, 'API_PAGE_SIZE', 100)))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, getattr(settings, 'API_MAX_PAGE_SIZE', 1000)))
+
+
+def _page(queryset, request, fields, descending=False):
+    """
+    Keyset pagination on (timestamp, id): the cursor is the last row of the
+    previous page, so every page is an index range scan instead of an OFFSET.
+    """
+    limit = _limit_param(request)
+    cursor = request.GET.get('cursor')
+
+    if descending:
+        queryset = queryset.order_by('-timestamp', '-id')
+        if cursor:
+            timestamp, pk = _decode_cursor(cursor)
+            queryset = queryset.filter(timestamp__lte=timestamp).exclude(timestamp=timestamp, id__gte=pk)
+    else:
+        queryset = queryset.order_by('timestamp', 'id')
+        if cursor:
+            timestamp, pk = _decode_cursor(cursor)
+            queryset = queryset.filter(timestamp__gte=timestamp).exclude(timestamp=timestamp, id__lte=pk)
+
+    rows = list(queryset.values(*fields)[:limit + 1])
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {'results': rows[:limit], 'next_cursor': next_cursor}
+
+
+def _json_body(request):
+    # Requiring a JSON body also keeps browsers from sending these requests
+    # cross-site without a CORS preflight.
+    if request.content_type != 'application/json':
+        raise ApiError('the request body must be JSON')
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        raise ApiError('the request body must be a JSON object')
+    return body
+
+
+def _json_urls(request):
+    urls = _json_body(request).get('urls')
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        raise ApiError('urls must be a list of strings')
+    limit = getattr(settings, 'API_BULK_LIMIT', 1000)
+    if len(urls) > limit:
+        raise ApiError(f'at most {limit} urls per request')
+    return list(dict.fromkeys(urls))
+
+
+def api_view(view_func):
+    """Answers ApiError with a JSON error response."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    return wrapper
+
+
+@require_GET
+@catalog_page
+@api_view
+def product_list(request):
+    """
+    Products with their price statistics, newest first.
+
+    Query parameters: `limit` (default API_PAGE_SIZE) and `cursor`, the
+    `next_cursor` of the previous page.
+    """
+    return JsonResponse(_page(Product.objects.with_price_stats(), request, PRODUCT_FIELDS, descending=True))
+
+
+@require_GET
+@catalog_page
+@api_view
+def product_history(request, pk):
+    """
+    Price observations of a product, oldest first.
+
+    Query parameters: `since` (ISO datetime) only returns later observations,
+    `limit` and `cursor` page through them like the product list.
+    """
+    if not Product.objects.filter(pk=pk).exists():
+        return JsonResponse({'error': 'product not found'}, status=404)
+
+    history = PriceHistory.objects.filter(product_id=pk)
+    since = _datetime_param(request, 'since')
+    if since is not None:
+        history = history.filter(timestamp__gt=since)
+    return JsonResponse(_page(history, request, HISTORY_FIELDS))
+
+
+@csrf_exempt
+@require_POST
+@api_view
+def bulk_add(request):
+    """
+    Queues many product URLs to be added by one background job.
+
+    Body: {"urls": [...]}. URLs that are invalid or already tracked are
+    reported back and skipped.
+    """
+    urls = _json_urls(request)
+
+    invalid = {}
+    valid = []
+    for url in urls:
+        form = ProductUrlForm({'url': url})
+        if form.is_valid():
+            valid.append(form.cleaned_data['url'])
+        else:
+            invalid[url] = form.errors['url'][0]
+
+    existing = set(Product.objects.filter(product_url__in=valid).values_list('product_url', flat=True))
+    new = [url for url in valid if url not in existing]
+
+    data = {'queued': new, 'existing': sorted(existing), 'invalid': invalid, 'job': None}
+    if new:
+        job, _ = enqueue_job(ADD_PRODUCTS, {'urls': new})
+        data['job'] = {'id': job.pk, 'status_url': reverse('job_status', args=[job.pk])}
+    return JsonResponse(data, status=202 if new else 200)
+
+
+@csrf_exempt
+@require_POST
+@api_view
+def bulk_delete(request):
+    """
+    Deletes the products with the given URLs together with their history.
+
+    Body: {"urls": [...]}.
+    """
+    urls = _json_urls(request)
+
+    deleted = 0
+    found = set()
+    for batch in chunked(urls, 500):
+        rows = list(Product.objects.filter(product_url__in=batch).values_list('id', 'product_url'))
+        if rows:
+            delete_products([pk for pk, _ in rows])
+            deleted += len(rows)
+            found.update(url for _, url in rows)
+
+    return JsonResponse({'deleted': deleted, 'not_found': [url for url in urls if url not in found]})
+
+
+@csrf_exempt
+@require_POST
+@api_view
+def create_alert(request, pk):
+    """
+    Creates a price alert for a product.
+
+    Body: {"kind": "below" or "drop", "threshold": price or percent, "email": ...}.
+    A rule whose condition already holds fires right away.
+    """
+    if not Product.objects.filter(pk=pk).exists():
+        return JsonResponse({'error': 'product not found'}, status=404)
+
+    form = AlertRuleForm(_json_body(request), instance=AlertRule(product_id=pk))
+    if not form.is_valid():
+        return JsonResponse({'error': 'invalid alert rule', 'fields': form.errors}, status=400)
+
+    rule = form.save()
+    evaluate_alerts([pk])
+    rule.refresh_from_db(fields=['triggered'])
+    return JsonResponse(
+        {'id': rule.pk, 'kind': rule.kind, 'threshold': rule.threshold, 'email': rule.email,
+         'triggered': rule.triggered},
+        status=201,
+    )
@@ -6,4 +6,12 @@ class ProductsConfig(AppConfig):
     name = 'products'
 
     def ready(self):
-        import products.signals
\ No newline at end of file
+        import products.signals
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate, post_save
+        from products.db import apply_sqlite_pragmas
+
+        connection_created.connect(apply_sqlite_pragmas)
+        post_migrate.connect(products.signals.restore_search_index, sender=self)
+        # The receiver checks PRICE_HISTORY_ON_SAVE itself, so the setting can be changed at runtime.
+        post_save.connect(products.signals.save_price_history, sender=self.get_model('Product'))
\ No newline at end of file
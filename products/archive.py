@@ -0,0 +1,148 @@
+"""
+Optional archive of fetched product pages, enabled with the PAGE_ARCHIVE setting.
+
+Every fetched page whose body changed is stored compressed, zstd when the
+optional zstandard package is installed and gzip otherwise. Bodies are
+deduplicated by their SHA-256: a PageSnapshot records which product showed
+which PageBlob when, so a page that never changes is stored once. Pages that
+answer 304, or with the body of the last fetch, are not archived at all.
+`manage.py reextract` reads the archive to rerun the extractors offline.
+"""
+import gzip
+import hashlib
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from products.models import PageBlob, PageSnapshot
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD = 'zstd'
+GZIP = 'gzip'
+
+
+def archive_enabled():
+    return getattr(settings, 'PAGE_ARCHIVE', False)
+
+
+def default_codec():
+    """zstd when the zstandard package is installed, gzip otherwise."""
+    return ZSTD if zstandard is not None else GZIP
+
+
+def compress(content, codec=None):
+    """
+    Compresses a page body.
+    :param content: body as bytes
+    :param codec: 'zstd' or 'gzip', defaults to default_codec()
+    :return: tuple (codec, compressed bytes)
+    """
+    codec = codec or default_codec()
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("The zstd codec needs the zstandard package")
+        return codec, zstandard.compress(content)
+    if codec == GZIP:
+        return codec, gzip.compress(content, mtime=0)
+    raise ValueError(f"Unknown archive codec '{codec}'")
+
+
+def decompress(codec, data):
+    """
+    :param codec: codec the body was compressed with
+    :param data: compressed body
+    :return: body as bytes
+    """
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("Pages archived with zstd need the zstandard package")
+        return zstandard.decompress(data)
+    if codec == GZIP:
+        return gzip.decompress(data)
+    raise ValueError(f"Unknown archive codec '{codec}'")
+
+
+class PageArchive:
+    """
+    Collects fetched pages and writes them in batches. `add` is called by the
+    fetching threads and compresses the page there, `flush` runs in the thread
+    that writes the results.
+    :param codec: compression codec, defaults to default_codec()
+    """
+
+    def __init__(self, codec=None):
+        self.codec = codec or default_codec()
+        # Pages dropped by the final flush because their URL never got a product.
+        self.skipped = 0
+        self._pages = []
+        self._lock = threading.Lock()
+
+    def add(self, url, text):
+        """
+        Buffers the page of a URL, fetched now.
+        :param url: product URL
+        :param text: decoded page source, as given to the extractor
+        """
+        content = text.encode('utf-8')
+        sha256 = hashlib.sha256(content).hexdigest()
+        codec, data = compress(content, self.codec)
+        with self._lock:
+            self._pages.append((url, timezone.now(), sha256, codec, data, len(content)))
+
+    def flush(self, product_id, final=False):
+        """
+        Writes the buffered pages of known products: new bodies as PageBlob,
+        and a PageSnapshot for every page. Pages of URLs without a product yet
+        stay buffered, their product may be created by a later flush.
+        :param product_id: callable returning the product id of a URL, or None
+        :param final: last flush of the refresh; pages of URLs that still have
+            no product, such as failed additions, are dropped and counted in `skipped`
+        :return: number of written snapshots
+        """
+        with self._lock:
+            pages, self._pages = self._pages, []
+        snapshots, blobs = [], {}
+        for page in pages:
+            url, fetched_at, sha256, codec, data, size = page
+            pk = product_id(url)
+            if pk is None:
+                if final:
+                    self.skipped += 1
+                    continue
+                with self._lock:
+                    self._pages.append(page)
+                continue
+            snapshots.append(PageSnapshot(product_id=pk, blob_id=sha256, fetched_at=fetched_at))
+            blobs[sha256] = PageBlob(sha256=sha256, codec=codec, data=data, size=size)
+
+        if snapshots:
+            PageBlob.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+            PageSnapshot.objects.bulk_create(snapshots)
+        return len(snapshots)
+
+
+def prune_archive(before):
+    """
+    Deletes the snapshots fetched before the given time, except the latest
+    snapshot of every product, and then every blob without a snapshot.
+    :param before: datetime
+    :return: tuple (deleted snapshots, deleted blobs)
+    """
+    latest = PageSnapshot.objects.filter(product=OuterRef('product')).order_by('-fetched_at', '-id').values('id')[:1]
+    snapshots, _ = PageSnapshot.objects.filter(fetched_at__lt=before).exclude(id=Subquery(latest)).delete()
+
+    # A raw DELETE, so the collector does not load the blobs to check the protected relation.
+    blob_table, snapshot_table = PageBlob._meta.db_table, PageSnapshot._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {blob_table} WHERE NOT EXISTS '
+            f'(SELECT 1 FROM {snapshot_table} WHERE {snapshot_table}.blob_id = {blob_table}.sha256)'
+        )
+        return snapshots, cursor.rowcount
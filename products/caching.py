@@ -0,0 +1,136 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from products.models import CatalogVersion
+
+VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    """
+    Returns the current catalog version. It is read from the cache and only
+    loaded from the database every CATALOG_VERSION_TTL seconds, so processes
+    that do not share the cache (the job worker and a local-memory cache)
+    see each other's writes after at most that delay.
+    :return: tuple (version, changed_at); changed_at is None before the first write
+    """
+    state = cache.get(VERSION_KEY)
+    if state is None:
+        state = CatalogVersion.objects.values_list('version', 'changed_at').first() or (0, None)
+        cache.set(VERSION_KEY, state, getattr(settings, 'CATALOG_VERSION_TTL', 5))
+    return state
+
+
+async def aget_catalog_version():
+    """Async version of get_catalog_version for async views."""
+    state = await cache.aget(VERSION_KEY)
+    if state is None:
+        state = await CatalogVersion.objects.values_list('version', 'changed_at').afirst() or (0, None)
+        await cache.aset(VERSION_KEY, state, getattr(settings, 'CATALOG_VERSION_TTL', 5))
+    return state
+
+
+def bump_catalog_version():
+    """
+    Increments the catalog version, which invalidates every cached page.
+    Call it in the transaction that writes observations or deletes products.
+    """
+    now = timezone.now()
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, changed_at=now):
+        CatalogVersion.objects.create(pk=1, version=1, changed_at=now)
+
+    # Forget the cached version now for this process, and again after the
+    # commit, in case another request cached the old version in the meantime.
+    cache.delete(VERSION_KEY)
+    transaction.on_commit(lambda: cache.delete(VERSION_KEY))
+
+
+def _bypasses_cache(request):
+    return request.method not in ('GET', 'HEAD') or len(get_messages(request))
+
+
+def _validators(version, changed_at):
+    etag = quote_etag(f'catalog-{version}')
+    last_modified = int(changed_at.timestamp()) if changed_at else None
+    return etag, last_modified
+
+
+def _page_key(request, view_func, version):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'catalog:page:{version}:{view_func.__name__}:{path}'
+
+
+def _cacheable(response):
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    return response.status_code == 200
+
+
+def _add_headers(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Browsers keep the page but revalidate it on every visit.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def catalog_page(view_func):
+    """
+    Caches a GET view by catalog version and answers conditional requests.
+
+    The ETag and Last-Modified headers are derived from the catalog version, so
+    a repeated request that is still current gets a 304 without any database
+    query, and the rendered response is shared until the next catalog write.
+    Requests with pending flash messages are always rendered. Async views get
+    an async wrapper that uses the async cache and ORM methods.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            if _bypasses_cache(request):
+                return await view_func(request, *args, **kwargs)
+
+            version, changed_at = await aget_catalog_version()
+            etag, last_modified = _validators(version, changed_at)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                key = _page_key(request, view_func, version)
+                response = await cache.aget(key)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                    if _cacheable(response):
+                        await cache.aset(key, response, getattr(settings, 'PAGE_CACHE_TIMEOUT', 600))
+            return _add_headers(response, etag, last_modified)
+
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if _bypasses_cache(request):
+            return view_func(request, *args, **kwargs)
+
+        version, changed_at = get_catalog_version()
+        etag, last_modified = _validators(version, changed_at)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = _page_key(request, view_func, version)
+            response = cache.get(key)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if _cacheable(response):
+                    cache.set(key, response, getattr(settings, 'PAGE_CACHE_TIMEOUT', 600))
+        return _add_headers(response, etag, last_modified)
+
+    return wrapper
@@ -0,0 +1,14 @@
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Configures every new SQLite connection with the SQLITE_PRAGMAS setting.
+    Receiver of the connection_created signal.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        # The raw connection is used so the pragmas do not show up as queries.
+        connection.connection.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,226 @@
+import re
+import threading
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+EMPTY_FIELDS = ("", None, "", "", "", "")
+
+SPEC_LINE_CLASS = "spec-content spec-line"
+
+
+def format_price(price_text):
+    """
+    Formats the price string to a float.
+    :param price_text: price string
+    :return: formatted price as float
+    """
+
+    price_text = price_text.replace('€', '').replace('-', '').replace('\xa0', '').strip()
+    price_text = price_text.replace('.', '')
+    price_text = price_text.replace(',', '.')
+
+    if price_text.count('.') == 1 and price_text.endswith('.'):
+        price_text = price_text[:-1]
+
+    return price_text
+
+
+class SoupExtractor:
+    """
+    Reference extractor: builds the full BeautifulSoup tree with html.parser.
+    Every other backend must return exactly the same fields.
+    """
+    name = "soup"
+    parser = "html.parser"
+
+    def parse(self, html):
+        return BeautifulSoup(html, self.parser)
+
+    def extract(self, html):
+        """
+        Extracts the product fields from a pricewatch page.
+        :param html: page source
+        :return: tuple (name, price, photo URL, supplier, supplier URL, description)
+        """
+        soup = self.parse(html)
+        if not soup:
+            return EMPTY_FIELDS
+
+        img_tag = soup.select_one("div.gallery-trigger img")
+        photo_url = img_tag["src"] if img_tag and img_tag.has_attr("src") else ""
+
+        name_block = soup.find("h1", class_="line-clamp")
+        name = name_block.get_text(strip=True) if name_block else ""
+
+        price = None
+        price_tag = soup.find("span", class_="lowest-price")
+        if price_tag:
+            price = format_price(price_tag.get_text(strip=True))
+
+        supplier_block = soup.find("span", class_="ellipsis")
+        supplier = supplier_block.get_text(strip=True) if supplier_block else ""
+
+        supplier_block_url = soup.find("a", class_="price")
+        supplier_url = supplier_block_url["href"] if supplier_block_url and supplier_block_url.has_attr("href") else ""
+
+        description = ""
+        all_specs = soup.find_all("div", class_=SPEC_LINE_CLASS)
+        for spec in all_specs:
+            description_block = spec.find("a", class_="line-clamp")
+            if description_block:
+                description = description_block.get_text(strip=True)
+                break
+
+        return name, price, photo_url, supplier, supplier_url, description
+
+
+# Every node a field is read from; the strainer keeps these with their subtrees.
+PRODUCT_NODES = SoupStrainer(
+    ["div", "h1", "span", "a"],
+    attrs={"class": re.compile(r"(?:^|\s)(?:gallery-trigger|spec-line|line-clamp|lowest-price|ellipsis|price)(?:\s|$)")},
+)
+
+
+class StrainedSoupExtractor(SoupExtractor):
+    """
+    BeautifulSoup extractor that only builds the nodes the fields are read from,
+    using lxml as the tokenizer when it is installed.
+    """
+    name = "strainer"
+    parser = "lxml" if lxml else "html.parser"
+
+    def parse(self, html):
+        return BeautifulSoup(html, self.parser, parse_only=PRODUCT_NODES)
+
+
+def _has_class(class_name):
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % class_name
+
+
+def _lxml_text(element):
+    return "".join(part.strip() for part in element.itertext())
+
+
+class LxmlExtractor:
+    """Extractor that queries the lxml tree with precompiled XPath expressions."""
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree
+
+        self.photo = etree.XPath("//div[%s]//img" % _has_class("gallery-trigger"))
+        self.name_block = etree.XPath("//h1[%s]" % _has_class("line-clamp"))
+        self.price = etree.XPath("//span[%s]" % _has_class("lowest-price"))
+        self.supplier = etree.XPath("//span[%s]" % _has_class("ellipsis"))
+        self.supplier_url = etree.XPath("//a[%s]" % _has_class("price"))
+        self.description = etree.XPath(
+            "//div[@class='%s']//a[%s]" % (SPEC_LINE_CLASS, _has_class("line-clamp"))
+        )
+
+    def extract(self, html):
+        if not html:
+            return EMPTY_FIELDS
+        tree = lxml.html.fromstring(html)
+
+        def first(xpath):
+            found = xpath(tree)
+            return found[0] if found else None
+
+        img_tag = first(self.photo)
+        photo_url = img_tag.get("src", "") if img_tag is not None else ""
+
+        name_block = first(self.name_block)
+        name = _lxml_text(name_block) if name_block is not None else ""
+
+        price_tag = first(self.price)
+        price = format_price(_lxml_text(price_tag)) if price_tag is not None else None
+
+        supplier_block = first(self.supplier)
+        supplier = _lxml_text(supplier_block) if supplier_block is not None else ""
+
+        supplier_block_url = first(self.supplier_url)
+        supplier_url = supplier_block_url.get("href", "") if supplier_block_url is not None else ""
+
+        description_block = first(self.description)
+        description = _lxml_text(description_block) if description_block is not None else ""
+
+        return name, price, photo_url, supplier, supplier_url, description
+
+
+class SelectolaxExtractor:
+    """Extractor built on the selectolax Lexbor HTML5 parser."""
+    name = "selectolax"
+
+    def extract(self, html):
+        if not html:
+            return EMPTY_FIELDS
+        tree = LexborHTMLParser(html)
+
+        img_tag = tree.css_first("div.gallery-trigger img")
+        photo_url = (img_tag.attributes.get("src") or "") if img_tag else ""
+
+        name_block = tree.css_first("h1.line-clamp")
+        name = name_block.text(strip=True) if name_block else ""
+
+        price_tag = tree.css_first("span.lowest-price")
+        price = format_price(price_tag.text(strip=True)) if price_tag else None
+
+        supplier_block = tree.css_first("span.ellipsis")
+        supplier = supplier_block.text(strip=True) if supplier_block else ""
+
+        supplier_block_url = tree.css_first("a.price")
+        supplier_url = (supplier_block_url.attributes.get("href") or "") if supplier_block_url else ""
+
+        description_block = tree.css_first('div[class="%s"] a.line-clamp' % SPEC_LINE_CLASS)
+        description = description_block.text(strip=True) if description_block else ""
+
+        return name, price, photo_url, supplier, supplier_url, description
+
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    StrainedSoupExtractor.name: StrainedSoupExtractor,
+}
+if lxml:
+    EXTRACTORS[LxmlExtractor.name] = LxmlExtractor
+if LexborHTMLParser:
+    EXTRACTORS[SelectolaxExtractor.name] = SelectolaxExtractor
+
+# Backend used without a SCRAPE_PARSER setting: lxml, the fastest one that is
+# installed by requirements.txt, or the strained soup when lxml is missing.
+DEFAULT_EXTRACTOR = LxmlExtractor.name if lxml else StrainedSoupExtractor.name
+
+_local = threading.local()
+
+
+def get_extractor(name=None):
+    """
+    Returns the extractor backend with the given name.
+    :param name: backend name, defaults to the SCRAPE_PARSER setting
+    :return: extractor instance with an extract(html) method, one per thread
+    """
+    if name is None:
+        from django.conf import settings
+
+        name = getattr(settings, 'SCRAPE_PARSER', DEFAULT_EXTRACTOR)
+
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown parser backend '{name}', available: {', '.join(EXTRACTORS)}")
+
+    instances = getattr(_local, 'instances', None)
+    if instances is None:
+        instances = _local.instances = {}
+    if name not in instances:
+        instances[name] = EXTRACTORS[name]()
+    return instances[name]
@@ -0,0 +1,158 @@
+import random
+import threading
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from products.metrics import current_page, timed
+
+FALLBACK_USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.3 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:137.0) Gecko/20100101 Firefox/137.0",
+]
+
+DEFAULT_HEADERS = {
+    "Accept-Language": "en-GB,en;q=0.9",
+    "Referer": "https://www.google.com/",
+}
+
+
+@lru_cache(maxsize=1)
+def get_user_agents(size=50):
+    """
+    Loads the user agent rotation list once per process.
+    :param size: number of desktop user agents to keep
+    :return: tuple of user agent strings
+    """
+    try:
+        from fake_useragent import UserAgent
+
+        browsers = UserAgent(platforms='desktop').data_browsers
+        agents = [browser['useragent'] for browser in browsers if browser.get('type') == 'desktop']
+    except Exception:
+        agents = []
+
+    return tuple(agents[:size]) or tuple(FALLBACK_USER_AGENTS)
+
+
+def random_user_agent():
+    """Returns a user agent string from the preloaded rotation list."""
+    return random.choice(get_user_agents())
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """Records the time spent in DNS lookup and TCP connect in the tracked PageStats."""
+
+    def connect(self):
+        with timed(current_page(), 'connect_seconds'):
+            super().connect()
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """Records the time spent in DNS lookup, TCP connect and TLS handshake in the tracked PageStats."""
+
+    def connect(self):
+        with timed(current_page(), 'connect_seconds'):
+            super().connect()
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections report how long they took to open."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class Fetcher:
+    """
+    HTTP client shared by all scrapes of the process.
+
+    It keeps a pool of keep-alive connections per host and retries failed
+    requests with exponential backoff, so repeated fetches from tweakers.net
+    reuse warm TLS connections instead of opening a new one each time.
+    """
+
+    def __init__(self, pool_size=None, retries=None, backoff=None, timeout=None):
+        self.pool_size = pool_size or getattr(settings, 'SCRAPE_MAX_WORKERS', 8)
+        self.retries = retries if retries is not None else getattr(settings, 'SCRAPE_RETRIES', 3)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'SCRAPE_BACKOFF', 0.5)
+        self.timeout = timeout or getattr(settings, 'SCRAPE_TIMEOUT', 15)
+        self.session = self._build_session()
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            raise_on_status=False,
+        )
+        adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get(self, url, headers=None):
+        """
+        Sends a GET request with a rotated user agent. The status, retries,
+        size and timings of the response are recorded in the tracked PageStats.
+        :param url: URL to fetch
+        :param headers: extra request headers
+        :return: requests.Response
+        """
+        request_headers = {"User-Agent": random_user_agent()}
+        if headers:
+            request_headers.update(headers)
+
+        page = current_page()
+        connect_seconds = page.connect_seconds if page is not None else 0
+        with timed(page, 'download_seconds'):
+            response = self.session.get(url, headers=request_headers, timeout=self.timeout)
+
+        if page is not None:
+            # Connections were opened within the request, count that time only once.
+            page.download_seconds -= page.connect_seconds - connect_seconds
+            page.status = response.status_code
+            page.bytes += len(response.content)
+            retries = getattr(response.raw, 'retries', None)
+            page.retries += len(retries.history) if retries else 0
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """Returns the process-wide Fetcher, creating it on first use."""
+    global _fetcher
+
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = Fetcher()
+    return _fetcher
@@ -2,6 +2,9 @@ from django import forms
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 
+from products.models import AlertRule
+
+
 class ProductUrlForm(forms.Form):
     """
     Form for adding a product by URL
@@ -25,4 +28,22 @@ class ProductUrlForm(forms.Form):
         if 'tweakers.net/pricewatch' not in url:
             raise ValidationError('Please enter a valid Tweakers.net product URL')
         
-        return url
\ No newline at end of file
+        return url
+
+class AlertRuleForm(forms.ModelForm):
+    """
+    Form for a price alert on a product
+    """
+    class Meta:
+        model = AlertRule
+        fields = ['kind', 'threshold', 'email']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        threshold = cleaned_data.get('threshold')
+        if threshold is not None:
+            if threshold <= 0:
+                self.add_error('threshold', 'The threshold must be positive.')
+            elif cleaned_data.get('kind') == AlertRule.DROP and threshold >= 100:
+                self.add_error('threshold', 'A price drop must be less than 100 percent.')
+        return cleaned_data
@@ -0,0 +1,201 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from products.models import Job, PriceHistory, Product
+
+ADD_PRODUCT = 'add_product'
+ADD_PRODUCTS = 'add_products'
+REFRESH = 'refresh'
+
+# Progress is written at most this often, so a large refresh does not turn
+# into one UPDATE of the job row per product.
+PROGRESS_INTERVAL = 1.0
+
+
+def enqueue_job(kind, payload=None, dedupe_key=''):
+    """
+    Queues a background job for the run_jobs worker.
+    :param kind: one of the keys of JOB_HANDLERS
+    :param payload: JSON-serializable arguments of the job
+    :param dedupe_key: while a job with this key is queued or running, that job is returned instead
+    :return: (job, created)
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    if dedupe_key:
+        active = Job.objects.filter(dedupe_key=dedupe_key, status__in=Job.ACTIVE_STATUSES).first()
+        if active:
+            return active, False
+
+    try:
+        with transaction.atomic():
+            return Job.objects.create(kind=kind, payload=payload or {}, dedupe_key=dedupe_key), True
+    except IntegrityError:
+        # Another request queued the same job between the lookup and the insert.
+        return Job.objects.get(dedupe_key=dedupe_key, status__in=Job.ACTIVE_STATUSES), False
+
+
+async def aenqueue_job(kind, payload=None, dedupe_key=''):
+    """
+    Async version of enqueue_job for async views.
+    Async code runs in autocommit mode, so the INSERT needs no savepoint.
+    :return: (job, created)
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    if dedupe_key:
+        active = await Job.objects.filter(dedupe_key=dedupe_key, status__in=Job.ACTIVE_STATUSES).afirst()
+        if active:
+            return active, False
+
+    try:
+        return await Job.objects.acreate(kind=kind, payload=payload or {}, dedupe_key=dedupe_key), True
+    except IntegrityError:
+        return await Job.objects.aget(dedupe_key=dedupe_key, status__in=Job.ACTIVE_STATUSES), False
+
+
+def claim_next_job():
+    """
+    Marks the oldest queued job as running.
+    The claim is a conditional UPDATE, so concurrent workers never run the same job.
+    :return: the claimed Job, or None when the queue is empty
+    """
+    while True:
+        job_id = Job.objects.filter(status=Job.QUEUED).order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, updated_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+
+
+def requeue_stale_jobs(stale_after=None):
+    """
+    Puts running jobs that did not report progress for a while back in the queue,
+    e.g. after the worker that claimed them was killed.
+    :param stale_after: seconds without progress, defaults to JOB_STALE_AFTER
+    :return: number of requeued jobs
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'JOB_STALE_AFTER', 600)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return Job.objects.filter(status=Job.RUNNING, updated_at__lt=cutoff).update(status=Job.QUEUED)
+
+
+def run_job(job):
+    """
+    Executes a claimed job and stores its outcome.
+    :param job: Job in the running state
+    :return: the updated Job
+    """
+    try:
+        job.result = JOB_HANDLERS[job.kind](job)
+        job.status = Job.DONE
+    except Exception as e:
+        job.status = Job.FAILED
+        job.error = str(e) or e.__class__.__name__
+        traceback.print_exc()
+
+    job.finished_at = job.updated_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'progress', 'total', 'finished_at', 'updated_at'])
+    return job
+
+
+def run_pending_jobs(max_jobs=None):
+    """
+    Runs queued jobs until the queue is empty.
+    :param max_jobs: stop after this many jobs
+    :return: number of jobs that were run
+    """
+    count = 0
+    while max_jobs is None or count < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        print(f"Running job {job}")
+        run_job(job)
+        print(f"Finished job {job}")
+        count += 1
+    return count
+
+
+def run_worker(poll_interval=2.0, burst=False):
+    """
+    Worker loop of the run_jobs management command.
+    :param poll_interval: seconds to sleep when the queue is empty
+    :param burst: exit as soon as the queue is empty
+    """
+    requeue_stale_jobs()
+    while True:
+        close_old_connections()
+        run_pending_jobs()
+        if burst:
+            return
+        time.sleep(poll_interval)
+
+
+def _add_product(job):
+    from products.utils import save_product_data
+
+    job.total = 1
+    product, created = save_product_data(job.payload['url'])
+    job.progress = 1
+    return {'product_id': product.pk, 'created': created}
+
+
+def _progress_reporter(job):
+    last_report = time.monotonic()
+
+    def report(result, total):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < PROGRESS_INTERVAL:
+            return
+        last_report = now
+        job.progress, job.total = result.total, total or 0
+        Job.objects.filter(pk=job.pk).update(progress=job.progress, total=job.total, updated_at=timezone.now())
+
+    return report
+
+
+def _add_products(job):
+    from products.refresh import refresh_products
+
+    result = refresh_products(job.payload['urls'], progress=_progress_reporter(job))
+    job.progress = job.total = result.total
+    return {'added': result.updated, 'unchanged': result.unchanged, 'failed': result.failed}
+
+
+def _refresh(job):
+    from products.refresh import refresh_products
+
+    initial_history_count = PriceHistory.objects.count()
+    result = refresh_products(job.payload.get('urls'), progress=_progress_reporter(job))
+
+    job.progress = job.total = result.total
+    return {
+        'updated': result.updated,
+        'unchanged': result.unchanged,
+        'failed': result.failed,
+        'products': Product.objects.count(),
+        'history_before': initial_history_count,
+        'history_after': PriceHistory.objects.count(),
+    }
+
+
+JOB_HANDLERS = {
+    ADD_PRODUCT: _add_product,
+    ADD_PRODUCTS: _add_products,
+    REFRESH: _refresh,
+}
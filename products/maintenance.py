@@ -0,0 +1,130 @@
+import resource
+import sys
+import time
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Subquery
+
+from products.caching import bump_catalog_version
+from products.models import (
+    AlertDelivery, AlertRule, PageSnapshot, PageValidator, PriceHistory, PriceSummary, Product, RefreshSchedule,
+)
+from products.observations import record_observations
+
+# Tables whose rows belong to a product, deleted before the product itself.
+# Archived page bodies are shared between products and removed by prune_archive.
+PRODUCT_TABLES = [AlertDelivery, AlertRule, PageSnapshot, PriceHistory, PriceSummary, RefreshSchedule]
+
+
+class Throughput:
+    """Counts processed rows and reports the rate since the start."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.count = 0
+
+    def add(self, count):
+        self.count += count
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.count / self.elapsed if self.elapsed else 0.0
+
+
+def max_rss_kb():
+    """Peak resident memory of the process in kilobytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux.
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most `size` items without materializing it.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def backfill_price_history(batch_size=1000, after_id=0, report=None):
+    """
+    Records the current price of every product as an observation at the time
+    the product was added, unless that observation already exists, so the
+    command can be stopped and run again at any time.
+    :param batch_size: products read and observations written per transaction
+    :param after_id: only products with a larger id are processed, to resume a run
+    :param report: optional callable(throughput, last product id) invoked after every batch
+    :return: Throughput with the number of created observations
+    """
+    already_recorded = PriceHistory.objects.filter(product=OuterRef('pk'), timestamp=OuterRef('timestamp'))
+    rows = (
+        Product.objects
+        .filter(id__gt=after_id, price__isnull=False)
+        .exclude(Exists(already_recorded))
+        .order_by('id')
+        .values_list('id', 'price', 'timestamp')
+        .iterator(chunk_size=batch_size)
+    )
+
+    throughput = Throughput()
+    for batch in chunked(rows, batch_size):
+        # Every batch is committed in its own transaction.
+        record_observations(batch, batch_size=batch_size)
+        throughput.add(len(batch))
+        if report is not None:
+            report(throughput, batch[-1][0])
+    return throughput
+
+
+def delete_products(product_ids):
+    """
+    Deletes products together with their history, summary, schedule, alerts,
+    page snapshots and page validator with one DELETE per table, bypassing the
+    ORM cascade collector.
+    :param product_ids: list of product ids, small enough for one IN clause
+    """
+    placeholders = ', '.join(['%s'] * len(product_ids))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        PageValidator.objects.filter(
+            product_url__in=Subquery(Product.objects.filter(id__in=product_ids).values('product_url'))
+        ).delete()
+        for model in PRODUCT_TABLES:
+            cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE product_id IN ({placeholders})', product_ids)
+        cursor.execute(f'DELETE FROM {Product._meta.db_table} WHERE id IN ({placeholders})', product_ids)
+        bump_catalog_version()
+
+
+def delete_products_in_batches(queryset, batch_size=500, report=None):
+    """
+    Deletes the products of a queryset in batches, each in its own transaction.
+    Batches are selected by id ranges, so an interrupted run simply continues
+    with the remaining products the next time.
+    :param queryset: products to delete
+    :param batch_size: products deleted per transaction
+    :param report: optional callable(throughput, last product id) invoked after every batch
+    :return: Throughput with the number of deleted products
+    """
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    throughput = Throughput()
+    last_id = 0
+
+    while True:
+        batch = list(ids.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return throughput
+        delete_products(batch)
+        last_id = batch[-1]
+        throughput.add(len(batch))
+        if report is not None:
+            report(throughput, last_id)
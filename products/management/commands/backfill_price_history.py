@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from products.maintenance import backfill_price_history
+
+
+class Command(BaseCommand):
+    help = ('Records the current price of every product as a price history observation at the time the '
+            'product was added. Products that already have that observation are skipped, so the command '
+            'can be interrupted and run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Observations written per transaction.')
+        parser.add_argument('--after-id', type=int, default=0, help='Resume after this product id.')
+
+    def handle(self, *args, **options):
+        def report(throughput, last_id):
+            self.stdout.write(
+                f'{throughput.count} observation(s) written, up to product id {last_id} '
+                f'({throughput.rate:.0f} rows/s)'
+            )
+
+        throughput = backfill_price_history(
+            batch_size=options['batch_size'], after_id=options['after_id'], report=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {throughput.count} price observation(s) in {throughput.elapsed:.1f}s '
+            f'({throughput.rate:.0f} rows/s).'
+        ))
@@ -0,0 +1,74 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from products.alerts import evaluate_alerts
+from products.maintenance import delete_products_in_batches
+from products.models import AlertRule, Product
+from products.observations import record_observations
+
+URL_PREFIX = 'https://tweakers.net/pricewatch/benchmark-alerts-'
+
+
+class Command(BaseCommand):
+    help = ('Measures alert evaluation of many rules against a refresh batch that changes the price of every '
+            'benchmark product. Benchmark products and rules are created and removed again by the command.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Products in the refresh batch.')
+        parser.add_argument('--rules', type=int, default=100000, help='Alert rules spread over the products.')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for prices and thresholds.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            # Inside the try, so an interrupted setup is cleaned up as well.
+            product_ids = self._create_products(options['products'])
+            self._create_rules(rng, product_ids, options['rules'])
+
+            self.stdout.write(f"{'round':<12}{'fired':>8}{'queries':>9}{'seconds':>9}{'rules/s':>11}")
+            start = timezone.now() - timedelta(days=1)
+            rounds = [
+                ('drop', lambda: rng.uniform(40, 99)),
+                ('still low', lambda: rng.uniform(30, 39)),
+                ('recover', lambda: 150.0),
+                ('drop again', lambda: rng.uniform(40, 99)),
+            ]
+            for number, (name, price) in enumerate(rounds, start=1):
+                record_observations(
+                    ((product_id, price(), start + timedelta(minutes=number)) for product_id in product_ids),
+                    batch_size=1000,
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    fired = evaluate_alerts(product_ids)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(f'{name:<12}{fired:>8}{len(queries):>9}{elapsed:>9.2f}'
+                                  f'{options["rules"] / elapsed:>11.0f}')
+        finally:
+            delete_products_in_batches(Product.objects.filter(product_url__startswith=URL_PREFIX))
+
+    def _create_products(self, count):
+        products = Product.objects.bulk_create(
+            (Product(name=f'Benchmark {number:08d}', price=100, product_url=f'{URL_PREFIX}{number:08d}/')
+             for number in range(count)),
+            batch_size=1000,
+        )
+        start = timezone.now() - timedelta(days=2)
+        record_observations(((product, 100, start) for product in products), batch_size=1000)
+        return [product.pk for product in products]
+
+    def _create_rules(self, rng, product_ids, count):
+        def rule():
+            if rng.random() < 0.5:
+                return AlertRule(product_id=rng.choice(product_ids), kind=AlertRule.BELOW,
+                                 threshold=round(rng.uniform(50, 99), 2), email='benchmark@example.com')
+            return AlertRule(product_id=rng.choice(product_ids), kind=AlertRule.DROP,
+                             threshold=rng.choice([5, 10, 20, 30, 40]), email='benchmark@example.com')
+
+        AlertRule.objects.bulk_create((rule() for _ in range(count)), batch_size=1000)
@@ -0,0 +1,133 @@
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from products.maintenance import delete_products_in_batches
+from products.models import PageValidator, Product
+from products.observations import record_observations
+from products.refresh import RefreshWriter
+
+URL_PREFIX = 'https://tweakers.net/pricewatch/benchmark-concurrency-'
+PAGE_SIZE = 9
+
+# SQLite defaults before the production settings: rollback journal, an fsync
+# on every commit and deferred transactions.
+LEGACY_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full'}
+
+
+def _read_list_page(page):
+    queryset = Product.objects.defer('description').with_price_stats().order_by('name', 'id')
+    list(queryset[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+    queryset.count()
+
+
+def _reader(stop, pages, latencies, errors):
+    rng = random.Random()
+    try:
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                _read_list_page(rng.randrange(pages))
+            except OperationalError:
+                errors.append(1)
+            else:
+                latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        connection.close()
+
+
+def _writer(stop, urls, batch_size, commits, errors):
+    """Writes refresh results for the benchmark products the way refresh_products does."""
+    rng = random.Random()
+    writer = RefreshWriter(batch_size)
+    try:
+        while not stop.is_set():
+            url = rng.choice(urls)
+            data = (f'Benchmark {url[-8:]}', str(rng.randint(100, 999)), '', url, 'Shop', '', '')
+            writer.add(url, data, PageValidator(product_url=url), None)
+            if writer.full:
+                try:
+                    writer.flush()
+                except OperationalError:
+                    # The buffered results are written with the next flush.
+                    errors.append(1)
+                else:
+                    commits.append(1)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Measures the latency of product list reads while a refresh writes to the database in '
+            'parallel. Benchmark products are created and removed again by the command.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Number of benchmark products.')
+        parser.add_argument('--readers', type=int, default=4, help='Number of concurrent reader threads.')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of every phase.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Refresh results per write transaction.')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Use the SQLite defaults (rollback journal, synchronous=FULL) for comparison.')
+
+    def handle(self, *args, **options):
+        if options['legacy']:
+            if connection.vendor != 'sqlite':
+                raise CommandError('--legacy only applies to SQLite.')
+            connections.close_all()
+            settings.SQLITE_PRAGMAS = LEGACY_PRAGMAS
+            connection.settings_dict['OPTIONS'].pop('transaction_mode', None)
+
+        try:
+            # Inside the try, so an interrupted setup is cleaned up as well.
+            urls = self._create_products(options['products'])
+            pages = max(1, Product.objects.count() // PAGE_SIZE)
+
+            self.stdout.write(f"{'phase':<10}{'reads':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+                              f"{'errors':>8}{'commits':>9}")
+            for phase, writing in (('idle', False), ('refresh', True)):
+                stop = threading.Event()
+                latencies, read_errors, commits, write_errors = [], [], [], []
+                threads = [
+                    threading.Thread(target=_reader, args=(stop, pages, latencies, read_errors))
+                    for _ in range(options['readers'])
+                ]
+                if writing:
+                    threads.append(threading.Thread(
+                        target=_writer, args=(stop, urls, options['batch_size'], commits, write_errors),
+                    ))
+
+                for thread in threads:
+                    thread.start()
+                time.sleep(options['seconds'])
+                stop.set()
+                for thread in threads:
+                    thread.join()
+
+                self.stdout.write(self._line(phase, latencies, len(read_errors) + len(write_errors), len(commits)))
+        finally:
+            delete_products_in_batches(Product.objects.filter(product_url__startswith=URL_PREFIX))
+
+    def _create_products(self, count):
+        urls = [f'{URL_PREFIX}{number:08d}/' for number in range(count)]
+        products = Product.objects.bulk_create(
+            (Product(name=f'Benchmark {url[-9:-1]}', price=100, product_url=url) for url in urls),
+            batch_size=1000,
+        )
+        record_observations(((product, product.price, None) for product in products), batch_size=1000)
+        return urls
+
+    def _line(self, phase, latencies, errors, commits):
+        if not latencies:
+            return f'{phase:<10}{0:>8}{"":>36}{errors:>8}{commits:>9}'
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return (f'{phase:<10}{len(latencies):>8}{statistics.median(latencies):>9.1f}{percentile(0.95):>9.1f}'
+                f'{percentile(0.99):>9.1f}{latencies[-1]:>9.1f}{errors:>8}{commits:>9}')
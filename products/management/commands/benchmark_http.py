@@ -0,0 +1,106 @@
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import Job, Product
+
+DEFAULT_PATHS = ['/', '/product/{id}/', '/product/{id}/history/?points=200']
+ADD_URL_PREFIX = 'https://tweakers.net/pricewatch/benchmark-http-'
+
+
+def _client(base_url, paths, product_ids, add_ratio, stop, latencies, errors):
+    rng = random.Random()
+    session = requests.Session()
+    csrf_token = None
+
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            if add_ratio and rng.random() < add_ratio:
+                if csrf_token is None:
+                    session.get(urljoin(base_url, '/add/'), timeout=30)
+                    csrf_token = session.cookies.get('csrftoken')
+                response = session.post(
+                    urljoin(base_url, '/add/'),
+                    data={'url': f'{ADD_URL_PREFIX}{rng.getrandbits(48):012x}/', 'csrfmiddlewaretoken': csrf_token},
+                    headers={'Referer': base_url},
+                    allow_redirects=False,
+                    timeout=30,
+                )
+            else:
+                path = rng.choice(paths).format(id=rng.choice(product_ids) if product_ids else 0)
+                response = session.get(urljoin(base_url, path), timeout=30)
+        except requests.RequestException:
+            errors.append(1)
+            continue
+
+        if response.status_code >= 400:
+            errors.append(1)
+        else:
+            latencies.append((time.perf_counter() - started) * 1000)
+    session.close()
+
+
+class Command(BaseCommand):
+    help = ('Load-tests running servers with concurrent clients and reports requests per second and latency '
+            'percentiles, e.g. the same code served by gunicorn (WSGI) and by uvicorn (ASGI).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', metavar='NAME=URL',
+                            help='Servers to compare, e.g. wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request, {id} is replaced by a random product id (repeatable).')
+        parser.add_argument('--concurrency', type=int, default=50, help='Number of concurrent clients.')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration per target.')
+        parser.add_argument('--add-ratio', type=float, default=0.0,
+                            help='Share of requests that POST a new product URL to /add/. The queued jobs '
+                                 'are removed afterwards, so the servers must use this database.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith(('http://', 'https://')):
+                raise CommandError(f'Invalid target {target!r}, expected NAME=URL.')
+            targets.append((name, url))
+
+        paths = options['paths'] or DEFAULT_PATHS
+        product_ids = list(Product.objects.order_by('?').values_list('id', flat=True)[:1000])
+
+        self.stdout.write(f"{'target':<10}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+                          f"{'errors':>8}")
+        try:
+            for name, url in targets:
+                stop = threading.Event()
+                latencies, errors = [], []
+                threads = [
+                    threading.Thread(
+                        target=_client,
+                        args=(url, paths, product_ids, options['add_ratio'], stop, latencies, errors),
+                    )
+                    for _ in range(options['concurrency'])
+                ]
+                for thread in threads:
+                    thread.start()
+                time.sleep(options['seconds'])
+                stop.set()
+                for thread in threads:
+                    thread.join()
+
+                self.stdout.write(self._line(name, latencies, len(errors), options['seconds']))
+        finally:
+            if options['add_ratio']:
+                Job.objects.filter(payload__url__startswith=ADD_URL_PREFIX).delete()
+
+    def _line(self, name, latencies, errors, seconds):
+        if not latencies:
+            return f'{name:<10}{0:>10}{"":>36}{errors:>8}'
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return (f'{name:<10}{len(latencies):>10}{len(latencies) / seconds:>9.0f}'
+                f'{statistics.median(latencies):>9.1f}{p99:>9.1f}{latencies[-1]:>9.1f}{errors:>8}')
@@ -0,0 +1,65 @@
+import multiprocessing
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.extractors import EXTRACTORS, get_extractor
+from products.maintenance import max_rss_kb
+
+PAGES_DIR = Path(__file__).resolve().parents[2] / 'testdata' / 'pages'
+
+
+def _run_backend(name, pages, rounds, queue):
+    extractor = get_extractor(name)
+    baseline = max_rss_kb()
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            extractor.extract(page)
+    elapsed = time.perf_counter() - started
+
+    queue.put((elapsed, max_rss_kb() - baseline))
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the HTML parser backends over saved pricewatch pages (pages/sec and peak memory).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', default=str(PAGES_DIR), help='Directory with saved .html pages.')
+        parser.add_argument('--rounds', type=int, default=20, help='How many times every page is parsed.')
+        parser.add_argument('--backend', action='append', choices=sorted(EXTRACTORS),
+                            help='Backend to benchmark, can be repeated (default: all installed).')
+
+    def handle(self, *args, **options):
+        paths = sorted(Path(options['pages']).glob('*.html'))
+        if not paths:
+            raise CommandError(f"No .html pages found in {options['pages']}")
+        pages = [path.read_text(encoding='utf-8') for path in paths]
+        backends = options['backend'] or list(EXTRACTORS)
+        rounds = options['rounds']
+
+        reference = [get_extractor('soup').extract(page) for page in pages]
+        for name in backends:
+            results = [get_extractor(name).extract(page) for page in pages]
+            if results != reference:
+                raise CommandError(f"Backend '{name}' returns different fields than the 'soup' reference")
+
+        self.stdout.write(f'{len(pages)} page(s), {rounds} round(s)')
+        self.stdout.write(f"{'backend':<12}{'pages/sec':>12}{'ms/page':>10}{'peak MB':>10}")
+
+        # Each backend runs in a fresh process so the peak memory of one
+        # backend does not hide the peak of the next.
+        context = multiprocessing.get_context('fork')
+        for name in backends:
+            queue = context.Queue()
+            process = context.Process(target=_run_backend, args=(name, pages, rounds, queue))
+            process.start()
+            elapsed, peak_kb = queue.get()
+            process.join()
+
+            parsed = len(pages) * rounds
+            self.stdout.write(
+                f'{name:<12}{parsed / elapsed:>12.1f}{elapsed * 1000 / parsed:>10.2f}{peak_kb / 1024:>10.1f}'
+            )
@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import resource
+import time
+from contextlib import redirect_stdout
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from products.maintenance import delete_products_in_batches, max_rss_kb
+from products.models import Product
+from products.refresh import refresh_products
+from products.standin import serve
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class RowCounter:
+    """Database execute wrapper that counts the rows written by the current thread."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+            self.rows += max(context['cursor'].rowcount, 0)
+        return result
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Command(BaseCommand):
+    help = ('Refreshes products against a local stand-in for tweakers.net and reports URLs per second, rows '
+            'written, CPU time and peak memory. The first round fetches every page, later rounds are '
+            'conditional refreshes in which --drift of the pages changed. Benchmark products are removed '
+            'again by the command; their scrape runs are kept and counted in the metrics.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--urls', type=int, nargs='+', default=[1000, 10000], help='Catalog sizes to run.')
+        parser.add_argument('--rounds', type=int, default=2, help='Refresh runs per catalog size.')
+        parser.add_argument('--workers', type=int, help='Concurrent fetches (default: SCRAPE_MAX_WORKERS).')
+        parser.add_argument('--batch-size', type=int, help='Results per write transaction.')
+        parser.add_argument('--latency', type=float, default=0.02, help='Mean server latency in seconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503.')
+        parser.add_argument('--drift', type=float, default=0.1, help='Probability that a page changed its price.')
+        parser.add_argument('--page-kb', type=int, default=100, help='Approximate size of a page.')
+
+    def handle(self, *args, **options):
+        server_options = {
+            'latency': options['latency'],
+            'error_rate': options['error_rate'],
+            'drift': options['drift'],
+            'page_kb': options['page_kb'],
+            'seed': 1,
+        }
+        # The server runs in its own process, so its CPU time is not measured.
+        context = multiprocessing.get_context('spawn')
+        ready = context.Queue()
+        server = context.Process(target=serve, args=(server_options, ready), daemon=True)
+        server.start()
+        try:
+            base_url = ready.get(timeout=30)
+        except Exception:
+            server.terminate()
+            raise CommandError('The stand-in server did not start.')
+
+        workers = options['workers'] or getattr(settings, 'SCRAPE_MAX_WORKERS', 8)
+        self.stdout.write(f'Stand-in server at {base_url}, {workers} worker(s)')
+        self.stdout.write(f"{'urls':>7}{'round':>7}{'seconds':>9}{'urls/s':>9}{'updated':>9}{'unchanged':>11}"
+                          f"{'failed':>8}{'rows':>9}{'cpu s':>8}{'peak MB':>9}")
+        try:
+            for count in options['urls']:
+                self._benchmark(base_url, count, workers, options)
+        finally:
+            server.terminate()
+            server.join()
+
+    def _benchmark(self, base_url, count, workers, options):
+        urls = [f'{base_url}/pricewatch/{number}/stand-in-product-{number}.html' for number in range(count)]
+        Product.objects.bulk_create((Product(product_url=url) for url in urls), batch_size=1000)
+
+        try:
+            for number in range(1, options['rounds'] + 1):
+                counter = RowCounter()
+                cpu = _cpu_seconds()
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter), open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                    result = refresh_products(
+                        urls, max_workers=workers, rate_per_host=0, batch_size=options['batch_size'],
+                    )
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f'{count:>7}{number:>7}{elapsed:>9.1f}{count / elapsed:>9.0f}{result.updated:>9}'
+                    f'{result.unchanged:>11}{result.failed:>8}{counter.rows:>9}{_cpu_seconds() - cpu:>8.1f}'
+                    f'{max_rss_kb() / 1024:>9.0f}'
+                )
+        finally:
+            delete_products_in_batches(Product.objects.filter(product_url__startswith=base_url))
@@ -0,0 +1,85 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Q
+
+from products.models import Product
+from products.search import search_products
+
+BRANDS = ['Samsung', 'Apple', 'Sony', 'Philips', 'Logitech', 'Asus', 'Lenovo', 'Bosch', 'Canon', 'Dell']
+KINDS = ['phone', 'tablet', 'headphones', 'monitor', 'laptop', 'mouse', 'keyboard', 'camera', 'printer', 'speaker']
+WORDS = ['wireless', 'black', 'white', 'pro', 'ultra', 'mini', 'max', 'gaming', 'office', 'portable', 'smart']
+QUERIES = ['samsung', 'sony headphones', 'wireless', 'pro laptop', 'gam', 'canon camera white', 'x42', 'nothingmatches']
+
+
+def _product(rng, number):
+    brand, kind = rng.choice(BRANDS), rng.choice(KINDS)
+    model = f'{rng.choice("ABCDEFGHKMNPRSTXZ")}{rng.randint(10, 9999)}'
+    name = f'{brand} {kind} {model} {rng.choice(WORDS)}'
+    # Like on pricewatch pages, the description is the product series.
+    description = f'{brand} {model[:3]} series'
+    return Product(name=name, description=description, product_url=f'https://tweakers.net/pricewatch/bench-{number}/')
+
+
+def _legacy_search(query):
+    """The search as it was before the full-text index: LIKE scans and Python dedupe."""
+    seen_names = set()
+    unique_products = []
+    for product in Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query)).order_by('id'):
+        if product.name not in seen_names:
+            unique_products.append(product)
+            seen_names.add(product.name)
+    return unique_products[:20]
+
+
+def _indexed_search(query):
+    return list(Paginator(search_products(query), 20).get_page(1).object_list)
+
+
+def _latency_ms(search, repeat):
+    timings = []
+    for query in QUERIES:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+class Command(BaseCommand):
+    help = ('Measures search latency against catalog size, comparing the full-text index with the old '
+            'LIKE search. Synthetic products are inserted in a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                            help='Catalog sizes to measure.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of every query per size.')
+        parser.add_argument('--skip-legacy', action='store_true', help='Only measure the indexed search.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        created = 0
+
+        self.stdout.write(f"{'products':>10}{'fts p50 ms':>12}{'fts p95 ms':>12}{'like p50 ms':>13}{'like p95 ms':>13}")
+
+        with transaction.atomic():
+            for size in sorted(options['sizes']):
+                Product.objects.bulk_create(
+                    (_product(rng, number) for number in range(created, size)),
+                    batch_size=1000,
+                )
+                created = max(created, size)
+
+                fts = _latency_ms(_indexed_search, options['repeat'])
+                line = f'{size:>10}{fts[0]:>12.2f}{fts[1]:>12.2f}'
+                if not options['skip_legacy']:
+                    like = _latency_ms(_legacy_search, options['repeat'])
+                    line += f'{like[0]:>13.2f}{like[1]:>13.2f}'
+                self.stdout.write(line)
+
+            transaction.set_rollback(True)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from products.alerts import deliver_alerts
+
+
+class Command(BaseCommand):
+    help = ('Sends the pending price alerts from the outbox by email. Failed alerts stay in the outbox '
+            'and are retried by the next run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Alerts sent per SMTP connection.')
+
+    def handle(self, *args, **options):
+        def report(sent, failed):
+            self.stdout.write(f'{sent} alert(s) sent, {failed} failed')
+
+        sent, failed = deliver_alerts(batch_size=options['batch_size'], report=report)
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f'Delivered {sent} price alert(s), {failed} failed.'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.transfer import FORMATS, export_history, guess_format
+
+
+class Command(BaseCommand):
+    help = ('Exports the price history to a CSV, JSON Lines or Parquet file with one row per observation. '
+            'Rows are streamed from the database, so memory use does not grow with the history.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format, guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows read per query.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or guess_format(options['path'])
+        if file_format is None:
+            raise CommandError('Cannot guess the format from the file name, use --format.')
+
+        def report(throughput):
+            self.stdout.write(f'{throughput.count} row(s) exported ({throughput.rate:.0f} rows/s)')
+
+        try:
+            throughput = export_history(
+                options['path'], file_format, batch_size=options['batch_size'], report=report,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {throughput.count} price observation(s) to {options["path"]} in '
+            f'{throughput.elapsed:.1f}s ({throughput.rate:.0f} rows/s).'
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.transfer import FORMATS, guess_format, import_history, read_history
+
+
+class Command(BaseCommand):
+    help = ('Imports price observations from a file written by export_history. Missing products are '
+            'created, and observations already recorded for the same URL and timestamp are skipped, '
+            'so the command can be interrupted and run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format, guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows written per transaction.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or guess_format(options['path'])
+        if file_format is None:
+            raise CommandError('Cannot guess the format from the file name, use --format.')
+
+        def report(throughput, skipped):
+            self.stdout.write(
+                f'{throughput.count} row(s) imported, {skipped} skipped ({throughput.rate:.0f} rows/s)'
+            )
+
+        try:
+            rows = read_history(options['path'], file_format, batch_size=options['batch_size'])
+            throughput, skipped = import_history(rows, batch_size=options['batch_size'], report=report)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {throughput.count} price observation(s), skipped {skipped} already recorded, in '
+            f'{throughput.elapsed:.1f}s ({throughput.rate:.0f} rows/s).'
+        ))
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.archive import prune_archive
+
+
+class Command(BaseCommand):
+    help = ('Deletes archived pages fetched more than --days ago, keeping the latest page of every product, '
+            'and the compressed bodies no page refers to any more, e.g. those of deleted products.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Keep the pages of this many days.')
+
+    def handle(self, *args, **options):
+        snapshots, blobs = prune_archive(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {snapshots} archived page(s) and {blobs} unused page blob(s).'))
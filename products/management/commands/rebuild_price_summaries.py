@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.observations import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the price summary of every product from its full price history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of summaries inserted per query.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = rebuild_summaries(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} price summaries in {elapsed:.1f}s.'))
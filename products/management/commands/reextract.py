@@ -0,0 +1,63 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from products.extractors import EXTRACTORS
+from products.reextract import reextract
+
+
+class Command(BaseCommand):
+    help = ('Reruns the extractor over the latest archived page of every product and backfills the name, price '
+            'and other fields it finds, without fetching anything. Pages are parsed by several processes. '
+            'Needs PAGE_ARCHIVE to have been enabled while the pages were fetched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Parser processes.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Pages per task and per transaction.')
+        parser.add_argument('--parser', choices=EXTRACTORS, help='Extractor backend (default: SCRAPE_PARSER).')
+        parser.add_argument('--since', help='Only pages fetched at or after this ISO 8601 date or datetime.')
+        parser.add_argument('--only-missing', action='store_true',
+                            help='Only products without a name or a price.')
+        parser.add_argument('--dry-run', action='store_true', help='Count the changes without writing them.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_datetime(options['since'])
+            except ValueError:
+                # Well-formed but out of range, such as month 13.
+                since = None
+            if since is None:
+                raise CommandError('--since must be an ISO 8601 date or datetime.')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        def report(result):
+            rate = result.total / (time.monotonic() - started)
+            self.stdout.write(f'{result.total} page(s) parsed ({rate:.0f} pages/s)')
+
+        # Forked parser processes must not share the database connection of the parent.
+        connections.close_all()
+        started = time.monotonic()
+        result = reextract(
+            parser=options['parser'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            since=since,
+            only_missing=options['only_missing'],
+            dry_run=options['dry_run'],
+            report=report,
+        )
+        elapsed = time.monotonic() - started
+
+        prefix = 'Would update' if options['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {result.updated} product(s), {result.unchanged} unchanged, {result.failed} without data, '
+            f'from {result.total} archived page(s) in {elapsed:.1f}s '
+            f'({result.total / elapsed if elapsed else 0:.0f} pages/s).'
+        ))
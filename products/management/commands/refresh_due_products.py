@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.scheduling import run_due_refreshes
+
+
+class Command(BaseCommand):
+    help = ('Refreshes only the products that are due according to their adaptive schedule. '
+            'Run it periodically, e.g. from cron every --minutes minutes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=float, default=10,
+                            help='Time budget of the run; at most minutes * requests per minute pages are fetched.')
+        parser.add_argument('--rpm', type=float,
+                            help='Global requests per minute (default: REFRESH_REQUESTS_PER_MINUTE).')
+
+    def handle(self, *args, **options):
+        rpm = options['rpm'] or getattr(settings, 'REFRESH_REQUESTS_PER_MINUTE', 60)
+        limit = max(1, int(rpm * options['minutes']))
+
+        started = time.monotonic()
+        result, still_due = run_due_refreshes(limit=limit, requests_per_minute=rpm)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {result.total} due product(s) in {elapsed:.1f}s: {result.updated} updated, '
+            f'{result.unchanged} unchanged, {result.failed} failed. {still_due} product(s) are still due.'
+        ))
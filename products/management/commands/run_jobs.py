@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from products.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Runs the background jobs (product adds and catalog refreshes) queued by the web views.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait before checking an empty queue again.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Job worker started.'))
+        run_worker(poll_interval=options['poll_interval'], burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS('Job queue is empty, worker stopped.'))
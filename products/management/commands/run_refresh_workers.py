@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import queue
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from products.scheduling import ensure_schedules, run_refresh_worker
+
+# How often the parent checks for workers that died without a result.
+POLL_SECONDS = 1.0
+
+
+def _worker(number, options, results):
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    try:
+        result = run_refresh_worker(
+            name,
+            batch_size=options['batch_size'],
+            lease_seconds=options['lease'],
+            requests_per_minute=options['worker_rpm'],
+            rate_per_host=options['worker_rate'],
+            max_batches=options['max_batches'],
+        )
+        results.put((number, name, result.updated, result.unchanged, result.failed, ''))
+    except Exception as e:
+        results.put((number, name, 0, 0, 0, str(e)))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Refreshes the due products with several worker processes. Workers claim leased batches of due '
+            'pages, so they never fetch the same page twice, and the pages of a crashed worker are claimed '
+            'again after the lease expired. Run the command on several hosts to spread the work further.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes.')
+        parser.add_argument('--batch-size', type=int, help='Pages per claim (default: REFRESH_CLAIM_BATCH_SIZE).')
+        parser.add_argument('--lease', type=int, help='Lease duration in seconds (default: REFRESH_LEASE_SECONDS).')
+        parser.add_argument('--rpm', type=float,
+                            help='Requests per minute of all workers together, 0 for no limit '
+                                 '(default: REFRESH_REQUESTS_PER_MINUTE).')
+        parser.add_argument('--rate', type=float,
+                            help='Requests per second per host of all workers together, 0 for no limit '
+                                 '(default: SCRAPE_RATE_PER_HOST).')
+        parser.add_argument('--max-batches', type=int, help='Stop every worker after this many batches.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        rpm = options['rpm'] if options['rpm'] is not None else getattr(settings, 'REFRESH_REQUESTS_PER_MINUTE', 60)
+        rate = options['rate'] if options['rate'] is not None else getattr(settings, 'SCRAPE_RATE_PER_HOST', 4)
+        # The request budget is shared, so more workers do not mean more load on the site.
+        options['worker_rpm'] = rpm / workers if rpm else None
+        options['worker_rate'] = rate / workers if rate else 0
+
+        ensure_schedules()
+        # Forked workers must not share the database connection of the parent.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=_worker, args=(number, options, results)) for number in range(workers)]
+
+        started = time.monotonic()
+        for process in processes:
+            process.start()
+        rows = self._collect(processes, results)
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - started
+
+        totals = [0, 0, 0]
+        for number, name, updated, unchanged, failed, error in rows:
+            if error:
+                self.stdout.write(self.style.ERROR(f'Worker {name} failed: {error}'))
+            else:
+                self.stdout.write(f'Worker {name}: {updated} updated, {unchanged} unchanged, {failed} failed')
+            totals = [totals[0] + updated, totals[1] + unchanged, totals[2] + failed]
+
+        pages = sum(totals)
+        summary = (f'Refreshed {pages} product(s) with {workers} worker(s) in {elapsed:.1f}s '
+                   f'({pages / elapsed if elapsed else 0:.1f} pages/s): {totals[0]} updated, '
+                   f'{totals[1]} unchanged, {totals[2]} failed.')
+        failed_workers = sum(1 for row in rows if row[-1])
+        if failed_workers:
+            raise CommandError(f'{failed_workers} worker(s) failed. {summary}')
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _collect(self, processes, results):
+        """
+        Waits for the result of every worker. A worker that exited without
+        putting a result, e.g. after an OOM kill, is reported as failed
+        instead of blocking the command forever.
+        :return: result rows sorted by worker number
+        """
+        rows, exited = {}, set()
+        while len(rows) < len(processes):
+            try:
+                row = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                for number, process in enumerate(processes):
+                    if number in rows or process.exitcode is None:
+                        continue
+                    # A result put right before the exit may still be in the pipe, so the
+                    # worker only counts as dead when it was gone at the previous poll too.
+                    if number in exited:
+                        name = f'{socket.gethostname()}:{process.pid}'
+                        rows[number] = (number, name, 0, 0, 0, f'exited with code {process.exitcode}')
+                    exited.add(number)
+            else:
+                rows[row[0]] = row
+        return [rows[number] for number in sorted(rows)]
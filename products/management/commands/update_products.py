@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.refresh import refresh_products
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the data of every tracked product URL using a pool of concurrent fetchers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Number of pages fetched in parallel (default: SCRAPE_MAX_WORKERS).')
+        parser.add_argument('--rate', type=float, help='Maximum requests per second per host (default: SCRAPE_RATE_PER_HOST).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        result = refresh_products(max_workers=options['workers'], rate_per_host=options['rate'])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {result.updated} product(s), {result.unchanged} unchanged, '
+            f'{result.failed} failed in {elapsed:.1f}s.'
+        ))
+
+        run = result.run
+        self.stdout.write(
+            f'Stage time: connect {run.connect_seconds:.1f}s, download {run.download_seconds:.1f}s, '
+            f'parse {run.parse_seconds:.1f}s, write {run.write_seconds:.1f}s; '
+            f'{run.bytes / 1e6:.1f} MB, {run.retries} retries, statuses {run.status_counts}.'
+        )
+        if run.selector_misses:
+            self.stdout.write(self.style.WARNING(f'Fields not found on parsed pages: {run.selector_misses}'))
+        for page in run.slowest_pages[:5]:
+            self.stdout.write(f"  {page['seconds']:.2f}s  {page['status']}  {page['url']}")
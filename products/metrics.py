@@ -0,0 +1,190 @@
+import heapq
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.models import ScrapeCounters, ScrapeRun
+
+# Fields returned by the extractors, in the order of Extractor.extract.
+FIELDS = ('name', 'price', 'photo_url', 'supplier', 'supplier_url', 'description')
+STAGES = ('connect', 'download', 'parse', 'write')
+# ScrapeRun fields added to the ScrapeCounters totals.
+COUNTERS = ('updated', 'unchanged', 'failed', 'retries', 'bytes', *(f'{stage}_seconds' for stage in STAGES))
+
+_local = threading.local()
+
+
+class PageStats:
+    """
+    Measurements of one page fetch. The fetcher and get_link_data fill in the
+    page that is tracked by the current thread, see `tracking`.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.status = None
+        self.retries = 0
+        self.bytes = 0
+        self.connect_seconds = 0.0
+        self.download_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.misses = ()
+
+    @property
+    def seconds(self):
+        return self.connect_seconds + self.download_seconds + self.parse_seconds
+
+
+@contextmanager
+def tracking(page):
+    """Makes `page` the PageStats that measurements in this thread are recorded in."""
+    previous = getattr(_local, 'page', None)
+    _local.page = page
+    try:
+        yield page
+    finally:
+        _local.page = previous
+
+
+def current_page():
+    """
+    :return: PageStats tracked by the current thread, or None
+    """
+    return getattr(_local, 'page', None)
+
+
+@contextmanager
+def timed(stats, attribute):
+    """Adds the time spent in the block to a seconds attribute of `stats`, if given."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            setattr(stats, attribute, getattr(stats, attribute) + time.perf_counter() - started)
+
+
+class ScrapeMetrics:
+    """
+    Aggregates the PageStats of a refresh run into a ScrapeRun.
+    Pages are added by the thread that writes the results.
+    :param slowest: number of slowest pages kept for the run summary
+    """
+
+    def __init__(self, slowest=10):
+        self.started_at = timezone.now()
+        self.slowest = slowest
+        self.outcomes = Counter()
+        self.status_counts = Counter()
+        self.selector_misses = Counter()
+        self.totals = Counter()
+        self.write_seconds = 0.0
+        self._slowest_pages = []
+
+    def add(self, page, outcome):
+        """
+        :param page: PageStats of the fetched page
+        :param outcome: 'updated', 'unchanged' or 'failed'
+        """
+        self.outcomes[outcome] += 1
+        self.status_counts[str(page.status) if page.status is not None else 'error'] += 1
+        self.selector_misses.update(page.misses)
+        self.totals.update(
+            retries=page.retries,
+            bytes=page.bytes,
+            connect_seconds=page.connect_seconds,
+            download_seconds=page.download_seconds,
+            parse_seconds=page.parse_seconds,
+        )
+
+        entry = (page.seconds, page.url, page.status)
+        if len(self._slowest_pages) < self.slowest:
+            heapq.heappush(self._slowest_pages, entry)
+        else:
+            heapq.heappushpop(self._slowest_pages, entry)
+
+    def save(self):
+        """
+        Stores the summary of the run and adds it to the ScrapeCounters.
+        :return: created ScrapeRun
+        """
+        with transaction.atomic():
+            run = self._create_run()
+            increments = {name: F(name) + getattr(run, name) for name in COUNTERS}
+            if not ScrapeCounters.objects.filter(pk=1).update(runs=F('runs') + 1, **increments):
+                ScrapeCounters.objects.create(pk=1, runs=1, **{name: getattr(run, name) for name in COUNTERS})
+        return run
+
+    def _create_run(self):
+        return ScrapeRun.objects.create(
+            started_at=self.started_at,
+            finished_at=timezone.now(),
+            pages=sum(self.outcomes.values()),
+            updated=self.outcomes['updated'],
+            unchanged=self.outcomes['unchanged'],
+            failed=self.outcomes['failed'],
+            retries=self.totals['retries'],
+            bytes=self.totals['bytes'],
+            connect_seconds=self.totals['connect_seconds'],
+            download_seconds=self.totals['download_seconds'],
+            parse_seconds=self.totals['parse_seconds'],
+            write_seconds=self.write_seconds,
+            status_counts=dict(self.status_counts),
+            selector_misses=dict(self.selector_misses),
+            slowest_pages=[
+                {'url': url, 'seconds': round(seconds, 3), 'status': status}
+                for seconds, url, status in sorted(self._slowest_pages, reverse=True)
+            ],
+        )
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def render_prometheus():
+    """
+    Renders the scrape metrics in the Prometheus text exposition format:
+    counters from the ScrapeCounters totals, which only ever grow, and gauges
+    describing the latest stored run. Metrics are read from the database, so
+    every process serves the same values.
+    :return: str
+    """
+    totals = ScrapeCounters.objects.filter(pk=1).first() or ScrapeCounters()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            lines.append(f'{name}{labels} {value or 0}')
+
+    metric('tweakers_scrape_runs_total', 'counter', 'Finished refresh runs.', [('', totals.runs)])
+    metric('tweakers_scrape_pages_total', 'counter', 'Fetched pages by outcome.',
+           [(_labels(outcome=outcome), getattr(totals, outcome)) for outcome in ('updated', 'unchanged', 'failed')])
+    metric('tweakers_scrape_retries_total', 'counter', 'HTTP requests retried by the fetcher.',
+           [('', totals.retries)])
+    metric('tweakers_scrape_bytes_total', 'counter', 'Downloaded response bytes.', [('', totals.bytes)])
+    metric('tweakers_scrape_stage_seconds_total', 'counter', 'Time spent per scrape stage.',
+           [(_labels(stage=stage), getattr(totals, f'{stage}_seconds')) for stage in STAGES])
+
+    last = ScrapeRun.objects.first()
+    if last is not None:
+        metric('tweakers_scrape_last_run_timestamp_seconds', 'gauge', 'End of the latest refresh run.',
+               [('', last.finished_at.timestamp())])
+        metric('tweakers_scrape_last_run_duration_seconds', 'gauge', 'Duration of the latest refresh run.',
+               [('', last.duration)])
+        metric('tweakers_scrape_last_run_pages', 'gauge', 'Pages fetched by the latest refresh run.',
+               [('', last.pages)])
+        metric('tweakers_scrape_last_run_responses', 'gauge', 'HTTP statuses of the latest refresh run.',
+               [(_labels(status=status), count) for status, count in sorted(last.status_counts.items())])
+        metric('tweakers_scrape_last_run_selector_misses', 'gauge',
+               'Parsed pages of the latest refresh run on which a field was not found.',
+               [(_labels(field=field), last.selector_misses.get(field, 0)) for field in FIELDS])
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+from django.db.models import Min
+import django.utils.timezone
+
+
+def fold_duplicate_products(apps, schema_editor):
+    """
+    Folds the rows of every product URL into a single catalog row.
+
+    The most recent priced row keeps the catalog data, gets the earliest timestamp
+    as its "added" date, and every priced row becomes a PriceHistory observation,
+    unless it already has history: the old migrate_price_history script wrote
+    one observation per priced row, and those are only moved to the keeper.
+    """
+    Product = apps.get_model('products', 'Product')
+    PriceHistory = apps.get_model('products', 'PriceHistory')
+
+    urls = Product.objects.values('product_url').annotate(first_added=Min('timestamp')).order_by()
+
+    for entry in urls.iterator():
+        url = entry['product_url']
+        rows = Product.objects.filter(product_url=url).order_by('timestamp', 'id')
+        keeper_id = (
+            rows.filter(price__isnull=False).values_list('id', flat=True).last()
+            or rows.values_list('id', flat=True).last()
+        )
+        duplicates = rows.exclude(id=keeper_id)
+
+        history = PriceHistory.objects.filter(product__in=rows)
+        with_history = set(history.values_list('product_id', flat=True))
+        recorded = set(history.values_list('price', 'timestamp'))
+        missing = [
+            (price, timestamp)
+            for row_id, price, timestamp in rows.filter(price__isnull=False).values_list('id', 'price', 'timestamp')
+            if row_id not in with_history and (price, timestamp) not in recorded
+        ]
+
+        PriceHistory.objects.filter(product__in=duplicates).update(product_id=keeper_id)
+        PriceHistory.objects.bulk_create(
+            (PriceHistory(product_id=keeper_id, price=price, timestamp=timestamp) for price, timestamp in missing),
+            batch_size=1000,
+        )
+
+        duplicates.delete()
+        Product.objects.filter(id=keeper_id).update(timestamp=entry['first_added'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_pricehistory_pagevalidator'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pricehistory',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(fold_duplicate_products, migrations.RunPython.noop),
+    ]
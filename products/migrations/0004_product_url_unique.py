@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_fold_duplicate_products'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='product_url',
+            field=models.URLField(unique=True),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_summaries(apps, schema_editor):
+    PriceHistory = apps.get_model('products', 'PriceHistory')
+    PriceSummary = apps.get_model('products', 'PriceSummary')
+
+    rows = (
+        PriceHistory.objects.order_by('product_id', 'timestamp', 'id')
+        .values_list('product_id', 'price', 'timestamp')
+        .iterator(chunk_size=2000)
+    )
+    summaries = {}
+    for product_id, price, timestamp in rows:
+        summary = summaries.get(product_id)
+        if summary is None:
+            summary = summaries[product_id] = PriceSummary(
+                product_id=product_id,
+                current_price=price,
+                min_price=price,
+                max_price=price,
+                first_seen=timestamp,
+                last_change_at=timestamp,
+            )
+        elif price != summary.current_price:
+            summary.last_change_at = timestamp
+
+        summary.current_price = price
+        summary.min_price = min(summary.min_price, price)
+        summary.max_price = max(summary.max_price, price)
+        summary.last_seen = timestamp
+        summary.observation_count += 1
+
+    PriceSummary.objects.bulk_create(summaries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSummary',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='products.product')),
+                ('current_price', models.FloatField()),
+                ('min_price', models.FloatField()),
+                ('max_price', models.FloatField()),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('last_change_at', models.DateTimeField()),
+                ('observation_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Price summaries',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
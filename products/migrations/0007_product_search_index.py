@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# The SQL is copied from products.search as it was when this migration was
+# written, so later changes to that module do not change the migration.
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5(
+        name, description,
+        content='products_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_ai AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_ad AFTER DELETE ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_au AFTER UPDATE OF name, description ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS products_product_fts_ai",
+    "DROP TRIGGER IF EXISTS products_product_fts_ad",
+    "DROP TRIGGER IF EXISTS products_product_fts_au",
+    "DROP TABLE IF EXISTS products_product_fts",
+]
+
+POSTGRES_CREATE = [
+    "CREATE INDEX IF NOT EXISTS product_search_idx ON products_product USING gin ("
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))",
+]
+
+POSTGRES_DROP = ["DROP INDEX IF EXISTS product_search_idx"]
+
+
+def _execute(schema_editor, statements):
+    statements = statements.get(schema_editor.connection.vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _execute(schema_editor, {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE})
+
+
+def remove_search_index(apps, schema_editor):
+    _execute(schema_editor, {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_pricesummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshSchedule',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='schedule', serialize=False, to='products.product')),
+                ('interval', models.PositiveIntegerField(help_text='Seconds between two refreshes of the page.')),
+                ('next_due_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['timestamp', 'id'], name='product_timestamp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_timestamp_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('finished_at', models.DateTimeField()),
+                ('pages', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('unchanged', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('retries', models.PositiveIntegerField(default=0)),
+                ('bytes', models.PositiveBigIntegerField(default=0)),
+                ('connect_seconds', models.FloatField(default=0)),
+                ('download_seconds', models.FloatField(default=0)),
+                ('parse_seconds', models.FloatField(default=0)),
+                ('write_seconds', models.FloatField(default=0)),
+                ('status_counts', models.JSONField(blank=True, default=dict)),
+                ('selector_misses', models.JSONField(blank=True, default=dict)),
+                ('slowest_pages', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
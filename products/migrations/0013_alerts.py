@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_scraperun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('below', 'Price at or below the threshold'), ('drop', 'Price at least threshold percent below the highest recorded price')], max_length=16)),
+                ('threshold', models.FloatField()),
+                ('email', models.EmailField(max_length=254)),
+                ('active', models.BooleanField(default=True)),
+                ('triggered', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='products.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AlertDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.FloatField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_deliveries', to='products.product')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='products.alertrule')),
+            ],
+            options={
+                'verbose_name_plural': 'Alert deliveries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='alertrule',
+            index=models.Index(fields=['product', 'triggered'], name='alertrule_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alertdelivery',
+            index=models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['id'], name='alertdelivery_pending_idx'),
+        ),
+    ]
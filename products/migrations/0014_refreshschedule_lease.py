@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshschedule',
+            name='leased_by',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='refreshschedule',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
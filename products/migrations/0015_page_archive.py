@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_refreshschedule_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('codec', models.CharField(max_length=8)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PageSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fetched_at', models.DateTimeField()),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='snapshots', to='products.pageblob')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'fetched_at'], name='pagesnapshot_product_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:35
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+COUNTERS = ('updated', 'unchanged', 'failed', 'retries', 'bytes',
+            'connect_seconds', 'download_seconds', 'parse_seconds', 'write_seconds')
+
+
+def seed_counters(apps, schema_editor):
+    """Starts the counters at the totals of the runs stored so far."""
+    ScrapeRun = apps.get_model('products', 'ScrapeRun')
+    ScrapeCounters = apps.get_model('products', 'ScrapeCounters')
+    totals = ScrapeRun.objects.aggregate(runs=Count('id'), **{name: Sum(name) for name in COUNTERS})
+    ScrapeCounters.objects.create(pk=1, **{name: value or 0 for name, value in totals.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_page_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('runs', models.PositiveBigIntegerField(default=0)),
+                ('updated', models.PositiveBigIntegerField(default=0)),
+                ('unchanged', models.PositiveBigIntegerField(default=0)),
+                ('failed', models.PositiveBigIntegerField(default=0)),
+                ('retries', models.PositiveBigIntegerField(default=0)),
+                ('bytes', models.PositiveBigIntegerField(default=0)),
+                ('connect_seconds', models.FloatField(default=0)),
+                ('download_seconds', models.FloatField(default=0)),
+                ('parse_seconds', models.FloatField(default=0)),
+                ('write_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Scrape counters',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -1,27 +1,294 @@
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_price_stats(self):
+        """
+        Annotates every product with min_price, max_price, first_added, last_added
+        and current_price read from its PriceSummary row.
+        """
+        return self.annotate(
+            min_price=F('summary__min_price'),
+            max_price=F('summary__max_price'),
+            first_added=F('summary__first_seen'),
+            last_added=F('summary__last_seen'),
+            current_price=Coalesce(F('price'), F('summary__current_price')),
+        )
 
 
 class Product(models.Model):
+    """A tracked product page: one row per URL holding the latest scraped data."""
     name = models.CharField(max_length=255, null=True, blank=True)
     price = models.FloatField(null=True, blank=True)
     photo_url = models.URLField(null=True, blank=True)
-    product_url = models.URLField()
+    product_url = models.URLField(unique=True)
     supplier = models.CharField(max_length=255, null=True, blank=True)
     supplier_url = models.URLField(null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='product_name_idx'),
+            models.Index(fields=['timestamp', 'id'], name='product_timestamp_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.price}€"
 
 
-
 class PriceHistory(models.Model):
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
+    """Price observed for a product at a point in time."""
+    # Indexed by the (product, timestamp) index below.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history', db_index=False)
     price = models.FloatField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['product', 'timestamp'], name='pricehistory_product_ts_idx'),
+            models.Index(fields=['timestamp'], name='pricehistory_ts_idx'),
+        ]
         verbose_name = 'Price history'
-        verbose_name_plural = 'Price history'
\ No newline at end of file
+        verbose_name_plural = 'Price history'
+
+
+class PageValidator(models.Model):
+    """HTTP cache validators of the last fetched page of a product URL."""
+    product_url = models.URLField(unique=True)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_modified = models.CharField(max_length=64, blank=True, default='')
+    body_hash = models.CharField(max_length=64, blank=True, default='')
+    checked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.product_url
+
+
+class PriceSummary(models.Model):
+    """Price statistics of a product, updated with every new PriceHistory observation."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    current_price = models.FloatField()
+    min_price = models.FloatField()
+    max_price = models.FloatField()
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    last_change_at = models.DateTimeField()
+    observation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Price summaries'
+
+    def __str__(self):
+        return f"{self.product_id}: {self.current_price}€ ({self.min_price}-{self.max_price}€)"
+
+
+class RefreshSchedule(models.Model):
+    """When a product page is due for its next refresh, see products.scheduling."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='schedule')
+    interval = models.PositiveIntegerField(help_text='Seconds between two refreshes of the page.')
+    next_due_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    # Set while a refresh worker holds the page; an expired lease can be claimed again.
+    leased_until = models.DateTimeField(null=True, blank=True)
+    leased_by = models.CharField(max_length=64, blank=True, default='')
+
+    def __str__(self):
+        return f"{self.product_id}: every {self.interval}s, next at {self.next_due_at}"
+
+
+class CatalogVersion(models.Model):
+    """Single-row counter bumped by every catalog write; cached pages are keyed by it."""
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Catalog version {self.version} ({self.changed_at})"
+
+
+class Job(models.Model):
+    """Background task queued by a view and executed by the run_jobs worker."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+    kind = models.CharField(max_length=32)
+    payload = models.JSONField(default=dict, blank=True)
+    dedupe_key = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Touched on every progress report, so jobs of a dead worker can be requeued.
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+        ]
+        constraints = [
+            # Only one queued or running job per dedupe key.
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=Q(status__in=['queued', 'running']) & ~Q(dedupe_key=''),
+                name='job_active_dedupe_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+
+class ScrapeRun(models.Model):
+    """Counters and stage timings of one refresh run, see products.metrics."""
+    started_at = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField()
+    pages = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0)
+    bytes = models.PositiveBigIntegerField(default=0)
+    # Seconds summed over all pages; the fetches overlap, so they can exceed the duration.
+    connect_seconds = models.FloatField(default=0)
+    download_seconds = models.FloatField(default=0)
+    parse_seconds = models.FloatField(default=0)
+    write_seconds = models.FloatField(default=0)
+    # {"200": 10, "304": 3, "error": 1}
+    status_counts = models.JSONField(default=dict, blank=True)
+    # Parsed pages on which a field was not found: {"price": 2}
+    selector_misses = models.JSONField(default=dict, blank=True)
+    # [{"url": ..., "seconds": ..., "status": ...}], slowest first
+    slowest_pages = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Scrape run {self.started_at}: {self.pages} page(s), {self.failed} failed"
+
+    @property
+    def duration(self):
+        return (self.finished_at - self.started_at).total_seconds()
+
+
+class ScrapeCounters(models.Model):
+    """
+    Single-row running totals of all scrape runs, the Prometheus counters.
+    Kept apart from ScrapeRun so the totals never decrease when runs are deleted.
+    """
+    runs = models.PositiveBigIntegerField(default=0)
+    updated = models.PositiveBigIntegerField(default=0)
+    unchanged = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    retries = models.PositiveBigIntegerField(default=0)
+    bytes = models.PositiveBigIntegerField(default=0)
+    connect_seconds = models.FloatField(default=0)
+    download_seconds = models.FloatField(default=0)
+    parse_seconds = models.FloatField(default=0)
+    write_seconds = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Scrape counters'
+
+    def __str__(self):
+        return f"{self.runs} scrape run(s)"
+
+
+class AlertRule(models.Model):
+    """Notifies an email address when the price of a product crosses a threshold, see products.alerts."""
+    BELOW = 'below'
+    DROP = 'drop'
+    KIND_CHOICES = [
+        (BELOW, 'Price at or below the threshold'),
+        (DROP, 'Price at least threshold percent below the highest recorded price'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='alert_rules')
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    threshold = models.FloatField()
+    email = models.EmailField()
+    active = models.BooleanField(default=True)
+    # Set when the rule fires and cleared when the price is back above the
+    # threshold, so a rule fires once per crossing.
+    triggered = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'triggered'], name='alertrule_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.threshold} for product {self.product_id} to {self.email}"
+
+
+class AlertDelivery(models.Model):
+    """Outbox entry of a fired AlertRule, sent by the deliver_alerts command."""
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE, related_name='deliveries')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='alert_deliveries')
+    price = models.FloatField()
+    created_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Only the pending entries are scanned by the drain.
+            models.Index(fields=['id'], condition=Q(delivered_at__isnull=True), name='alertdelivery_pending_idx'),
+        ]
+        verbose_name_plural = 'Alert deliveries'
+
+    def __str__(self):
+        return f"Alert {self.rule_id} at {self.price} ({'sent' if self.delivered_at else 'pending'})"
+
+
+class PageBlob(models.Model):
+    """Compressed body of an archived page, stored once per content hash, see products.archive."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    codec = models.CharField(max_length=8)
+    data = models.BinaryField()
+    # Size of the uncompressed body in bytes.
+    size = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.codec}, {len(self.data)}/{self.size} bytes)"
+
+
+class PageSnapshot(models.Model):
+    """A fetched page of a product whose body changed, pointing to its PageBlob."""
+    # Indexed by the (product, fetched_at) index below.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots', db_index=False)
+    blob = models.ForeignKey(PageBlob, on_delete=models.PROTECT, related_name='snapshots')
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'fetched_at'], name='pagesnapshot_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"Page of product {self.product_id} at {self.fetched_at}"
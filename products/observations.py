@@ -0,0 +1,155 @@
+from django.db import transaction
+from django.utils import timezone
+
+from products.caching import bump_catalog_version
+from products.models import PriceHistory, PriceSummary
+
+SUMMARY_FIELDS = [
+    'current_price', 'min_price', 'max_price', 'first_seen', 'last_seen', 'last_change_at', 'observation_count',
+]
+
+
+def record_observations(observations, only_changes=False, batch_size=500):
+    """
+    Records a batch of price observations with bulk inserts and folds them into
+    the PriceSummary rows of their products within the same transaction.
+
+    The summaries of all products in the batch are read with one query, which
+    is also what the observations are diffed against with `only_changes`.
+    :param observations: iterable of (product or product id, price, timestamp or None)
+    :param only_changes: skip observations whose price equals the previous price of the product
+    :param batch_size: number of rows written per query
+    :return: list of created PriceHistory
+    """
+    now = timezone.now()
+    history = sorted(
+        (
+            PriceHistory(product_id=getattr(product, 'pk', product), price=float(price), timestamp=timestamp or now)
+            for product, price, timestamp in observations
+        ),
+        key=lambda row: row.timestamp,
+    )
+    if not history:
+        return history
+
+    with transaction.atomic():
+        summaries = PriceSummary.objects.select_for_update().in_bulk({row.product_id for row in history})
+        existing = set(summaries)
+
+        if only_changes:
+            last_prices = {product_id: summary.current_price for product_id, summary in summaries.items()}
+            changed = []
+            for row in history:
+                if last_prices.get(row.product_id) != row.price:
+                    changed.append(row)
+                    last_prices[row.product_id] = row.price
+            history = changed
+
+        PriceHistory.objects.bulk_create(history, batch_size=batch_size)
+
+        for row in history:
+            summary = summaries.get(row.product_id)
+            if summary is None:
+                summaries[row.product_id] = PriceSummary(
+                    product_id=row.product_id,
+                    current_price=row.price,
+                    min_price=row.price,
+                    max_price=row.price,
+                    first_seen=row.timestamp,
+                    last_seen=row.timestamp,
+                    last_change_at=row.timestamp,
+                    observation_count=1,
+                )
+                continue
+
+            summary.min_price = min(summary.min_price, row.price)
+            summary.max_price = max(summary.max_price, row.price)
+            summary.first_seen = min(summary.first_seen, row.timestamp)
+            if row.timestamp >= summary.last_seen:
+                if row.price != summary.current_price:
+                    summary.last_change_at = row.timestamp
+                summary.current_price = row.price
+                summary.last_seen = row.timestamp
+            summary.observation_count += 1
+
+        written = {row.product_id for row in history}
+        PriceSummary.objects.bulk_update(
+            [summary for product_id, summary in summaries.items() if product_id in existing & written],
+            SUMMARY_FIELDS,
+            batch_size=batch_size,
+        )
+        PriceSummary.objects.bulk_create(
+            [summary for product_id, summary in summaries.items() if product_id not in existing],
+            batch_size=batch_size,
+        )
+
+        if history:
+            bump_catalog_version()
+
+    return history
+
+
+def summarize_history(rows):
+    """
+    Builds PriceSummary rows from price observations.
+    :param rows: iterable of (product_id, price, timestamp) ordered by product and timestamp
+    :return: generator of PriceSummary instances, one per product
+    """
+    summary = None
+
+    for product_id, price, timestamp in rows:
+        if summary is None or summary.product_id != product_id:
+            if summary is not None:
+                yield summary
+            summary = PriceSummary(
+                product_id=product_id,
+                current_price=price,
+                min_price=price,
+                max_price=price,
+                first_seen=timestamp,
+                last_seen=timestamp,
+                last_change_at=timestamp,
+                observation_count=0,
+            )
+        elif price != summary.current_price:
+            summary.last_change_at = timestamp
+
+        summary.current_price = price
+        summary.min_price = min(summary.min_price, price)
+        summary.max_price = max(summary.max_price, price)
+        summary.last_seen = timestamp
+        summary.observation_count += 1
+
+    if summary is not None:
+        yield summary
+
+
+def rebuild_summaries(batch_size=1000):
+    """
+    Recomputes every PriceSummary from the full price history.
+    :param batch_size: number of summaries inserted per query
+    :return: number of summaries written
+    """
+    rows = (
+        PriceHistory.objects.order_by('product_id', 'timestamp', 'id')
+        .values_list('product_id', 'price', 'timestamp')
+        .iterator(chunk_size=batch_size)
+    )
+    count = 0
+
+    with transaction.atomic():
+        PriceSummary.objects.all().delete()
+
+        batch = []
+        for summary in summarize_history(rows):
+            batch.append(summary)
+            if len(batch) >= batch_size:
+                PriceSummary.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+
+        PriceSummary.objects.bulk_create(batch)
+        count += len(batch)
+        bump_catalog_version()
+
+    return count
@@ -0,0 +1,165 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from products.alerts import evaluate_alerts
+from products.archive import decompress
+from products.caching import bump_catalog_version
+from products.extractors import get_extractor
+from products.maintenance import chunked
+from products.models import PageBlob, PageSnapshot, Product
+from products.observations import record_observations
+from products.refresh import CATALOG_FIELDS, RefreshResult
+
+
+def extract_pages(parser, pages):
+    """
+    Runs the extractor over archived pages. Touches no database, so it can run
+    in a worker process.
+    :param parser: extractor backend name
+    :param pages: list of (product id, codec, compressed page)
+    :return: list of (product id, fields in the order of CATALOG_FIELDS), fields
+        is None when the page could not be parsed or holds neither a name nor a price
+    """
+    extractor = get_extractor(parser)
+    results = []
+    for product_id, codec, data in pages:
+        try:
+            name, price, *rest = extractor.extract(decompress(codec, data).decode('utf-8'))
+            price = float(price) if price is not None else None
+        except Exception as e:
+            print(f"Failed to extract the archived page of product {product_id} ({e})")
+            results.append((product_id, None))
+            continue
+        results.append((product_id, [name, price, *rest] if name or price is not None else None))
+    return results
+
+
+def latest_pages(since=None, only_missing=False):
+    """
+    :param since: only products whose latest page was fetched at or after this time
+    :param only_missing: only products without a name or a price
+    :return: products with an archived page, annotated with the blob and fetch time of the latest one
+    """
+    latest = PageSnapshot.objects.filter(product=OuterRef('pk')).order_by('-fetched_at', '-id')
+    products = Product.objects.annotate(
+        archived_blob=Subquery(latest.values('blob_id')[:1]),
+        archived_at=Subquery(latest.values('fetched_at')[:1]),
+    ).filter(archived_blob__isnull=False)
+    if since is not None:
+        products = products.filter(archived_at__gte=since)
+    if only_missing:
+        products = products.filter(Q(name__isnull=True) | Q(name='') | Q(price__isnull=True))
+    return products
+
+
+class Backfill:
+    """
+    Merges re-extracted fields into the catalog. Only fields the extractor
+    found overwrite the stored ones, and a changed price is recorded as an
+    observation at the time the page was fetched.
+    :param dry_run: count the changes without writing them
+    """
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.result = RefreshResult()
+
+    def apply(self, extracted, stored):
+        """
+        Writes the changes of one batch in one transaction.
+        :param extracted: list of (product id, fields or None) returned by extract_pages
+        :param stored: mapping of product id to (fetch time, stored fields)
+        """
+        products, observations = [], []
+        for product_id, fields in extracted:
+            fetched_at, known = stored[product_id]
+            if fields is None:
+                self.result.failed += 1
+                continue
+
+            merged = [new if new not in ('', None) else old for new, old in zip(fields, known)]
+            if merged == known:
+                self.result.unchanged += 1
+                continue
+
+            products.append(Product(pk=product_id, **dict(zip(CATALOG_FIELDS, merged))))
+            if merged[1] is not None and merged[1] != known[1]:
+                observations.append((product_id, merged[1], fetched_at))
+            self.result.updated += 1
+
+        if self.dry_run or not products:
+            return
+        with transaction.atomic():
+            Product.objects.bulk_update(products, CATALOG_FIELDS)
+            recorded = record_observations(observations, only_changes=True)
+            if recorded:
+                evaluate_alerts({observation.product_id for observation in recorded})
+            bump_catalog_version()
+
+
+def reextract(parser=None, workers=1, batch_size=200, since=None, only_missing=False, dry_run=False,
+              report=None):
+    """
+    Reruns the extractor over the latest archived page of every product and
+    backfills the catalog, without any network traffic.
+
+    Products are streamed in batches; the pages of a batch are read with one
+    query and parsed by a pool of worker processes, while all database writes
+    happen in the calling process.
+    :param parser: extractor backend name, defaults to SCRAPE_PARSER
+    :param workers: number of worker processes, 1 parses in the calling process
+    :param batch_size: pages per task and per write transaction
+    :param since: only products whose latest page was fetched at or after this time
+    :param only_missing: only products without a name or a price
+    :param dry_run: count the changes without writing them
+    :param report: optional callable(result) invoked after every written batch
+    :return: RefreshResult with the number of updated, unchanged and failed products
+    """
+    if parser is None:
+        parser = get_extractor().name
+    rows = (
+        latest_pages(since, only_missing)
+        .order_by('id')
+        .values_list('id', 'archived_blob', 'archived_at', *CATALOG_FIELDS)
+        .iterator(chunk_size=batch_size)
+    )
+    backfill = Backfill(dry_run)
+    stored = {}
+
+    def tasks():
+        for batch in chunked(rows, batch_size):
+            blobs = PageBlob.objects.only('codec', 'data').in_bulk({row[1] for row in batch})
+            pages = []
+            for product_id, blob_id, fetched_at, *fields in batch:
+                stored[product_id] = (fetched_at, fields)
+                pages.append((product_id, blobs[blob_id].codec, bytes(blobs[blob_id].data)))
+            yield pages
+
+    def done(extracted):
+        backfill.apply(extracted, stored)
+        for product_id, _ in extracted:
+            del stored[product_id]
+        if report is not None:
+            report(backfill.result)
+
+    if workers <= 1:
+        for pages in tasks():
+            done(extract_pages(parser, pages))
+        return backfill.result
+
+    # Forked workers only parse; they never use the inherited database connection.
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        pending = set()
+        for pages in tasks():
+            pending.add(executor.submit(extract_pages, parser, pages))
+            # Keep the queue short so a huge archive does not pile up in memory.
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done(future.result())
+        for future in pending:
+            done(future.result())
+    return backfill.result
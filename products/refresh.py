@@ -0,0 +1,303 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from products.alerts import evaluate_alerts
+from products.archive import PageArchive, archive_enabled
+from products.caching import bump_catalog_version
+from products.maintenance import chunked
+from products.metrics import PageStats, ScrapeMetrics, timed, tracking
+from products.models import PageValidator, Product
+from products.observations import record_observations
+from products.utils import get_link_data
+
+
+class HostRateLimiter:
+    """
+    Thread-safe limiter that spaces out requests to the same host.
+    :param rate: maximum number of requests per second for a single host
+    :param per_host: when False, the rate applies to all hosts together
+    """
+
+    def __init__(self, rate, per_host=True):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.per_host = per_host
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """
+        Blocks until the next request to the host of the given URL is allowed.
+        :param url: URL that is about to be fetched
+        """
+        if not self.interval:
+            return
+
+        host = urlsplit(url).netloc if self.per_host else None
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RefreshResult:
+    """Counters collected during a refresh run."""
+
+    def __init__(self):
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        # ScrapeRun with the timings of the run, stored when it finishes.
+        self.run = None
+
+    @property
+    def total(self):
+        return self.updated + self.unchanged + self.failed
+
+
+def _fetch(url, validator, limiters, page, archive):
+    for limiter in limiters:
+        limiter.wait(url)
+    with tracking(page):
+        return get_link_data(url, validator=validator, archive=archive)
+
+
+CATALOG_FIELDS = ('name', 'price', 'photo_url', 'supplier', 'supplier_url', 'description')
+VALIDATOR_FIELDS = ('etag', 'last_modified', 'body_hash')
+
+
+def _validator_state(validator):
+    return tuple(getattr(validator, field) for field in VALIDATOR_FIELDS)
+
+
+def _for_urls(queryset, urls):
+    """
+    :param urls: product URLs, or None for every row
+    :return: iterable of the rows of the URLs, looked up in chunks to stay below the query parameter limit
+    """
+    if urls is None:
+        return queryset
+    return (row for chunk in chunked(urls, 1000) for row in queryset.filter(product_url__in=chunk))
+
+
+class RefreshWriter:
+    """
+    Buffers the results of a refresh and writes them in batches.
+
+    The products of the refreshed URLs are preloaded, so a parsed page is
+    compared with the stored product in memory: unchanged pages only update the check time of
+    their PageValidator, and a price observation is only recorded when the
+    price differs from the last known one. Each flush runs in one transaction.
+    With PAGE_ARCHIVE enabled, the fetched pages collected in `archive` are
+    written by the same flush.
+    :param batch_size: number of buffered results that triggers a flush
+    :param urls: URLs whose results will be added, None preloads the whole catalog
+    """
+
+    def __init__(self, batch_size, urls=None):
+        self.batch_size = batch_size
+        self.catalog = {
+            url: (product_id, fields)
+            for url, product_id, *fields in _for_urls(
+                Product.objects.values_list('product_url', 'id', *CATALOG_FIELDS), urls,
+            )
+        }
+        self.archive = PageArchive() if archive_enabled() else None
+        self._reset()
+
+    def _product_id(self, url):
+        known = self.catalog.get(url)
+        return known[0] if known is not None else None
+
+    def _reset(self):
+        self.validators = []
+        self.checked = []
+        self.products = []
+        self.new_products = []
+        self.observations = []
+        self.pending = 0
+
+    def add(self, url, data, validator, validator_state):
+        """
+        Buffers the result of one fetched page.
+        :param url: product URL
+        :param data: tuple returned by get_link_data, or None when the page did not change
+        :param validator: PageValidator of the URL, updated by the fetch
+        :param validator_state: validator fields before the fetch
+        :return: True when the product data changed
+        """
+        changed = False
+        if data is not None:
+            name, price, photo_url, _, supplier, supplier_url, description = data
+            if not name and price is None:
+                raise ValueError("no product data found on the page")
+
+            price = float(price) if price is not None else None
+            fields = [name, price, photo_url, supplier, supplier_url, description]
+            known = self.catalog.get(url)
+
+            if known is None:
+                self.new_products.append(Product(product_url=url, **dict(zip(CATALOG_FIELDS, fields))))
+                changed = True
+            elif fields != known[1]:
+                product_id, known_fields = known
+                self.products.append(Product(pk=product_id, **dict(zip(CATALOG_FIELDS, fields))))
+                if price is not None and price != known_fields[1]:
+                    self.observations.append((product_id, price, timezone.now()))
+                self.catalog[url] = (product_id, fields)
+                changed = True
+
+        validator.checked_at = timezone.now()
+        if validator.pk is None or _validator_state(validator) != validator_state:
+            self.validators.append(validator)
+        else:
+            self.checked.append(url)
+
+        self.pending += 1
+        return changed
+
+    @property
+    def full(self):
+        return self.pending >= self.batch_size
+
+    def flush(self, final=False):
+        """
+        Writes every buffered result in one transaction.
+        :param final: last flush of the refresh, drops archived pages of URLs without a product
+        """
+        if not self.pending:
+            if final and self.archive is not None:
+                self.archive.flush(self._product_id, final=True)
+            return
+
+        with transaction.atomic():
+            if self.checked:
+                PageValidator.objects.filter(product_url__in=self.checked).update(checked_at=timezone.now())
+            if self.validators:
+                PageValidator.objects.bulk_create(
+                    self.validators,
+                    update_conflicts=True,
+                    unique_fields=['product_url'],
+                    update_fields=[*VALIDATOR_FIELDS, 'checked_at'],
+                )
+            if self.products:
+                Product.objects.bulk_update(self.products, CATALOG_FIELDS)
+            if self.new_products:
+                Product.objects.bulk_create(self.new_products)
+                for product in self.new_products:
+                    self.catalog[product.product_url] = (product.pk, [getattr(product, f) for f in CATALOG_FIELDS])
+                    if product.price is not None:
+                        self.observations.append((product.pk, product.price, product.timestamp))
+            if self.archive is not None:
+                self.archive.flush(self._product_id, final=final)
+            observations = record_observations(self.observations, only_changes=True)
+            if observations:
+                evaluate_alerts({observation.product_id for observation in observations})
+            if self.products or self.new_products:
+                bump_catalog_version()
+
+        self._reset()
+
+
+def refresh_products(urls=None, max_workers=None, rate_per_host=None, progress=None, requests_per_minute=None,
+                     batch_size=None, metrics=None):
+    """
+    Fetches product pages concurrently and saves the results in batches.
+
+    Pages are downloaded by a bounded pool of worker threads, while all database
+    writes happen in the calling thread, so SQLite only ever sees one writer.
+    Every changed page updates the catalog row of its product, and a price
+    observation is recorded only when the price differs from the last one.
+    Requests are conditional on the stored PageValidator of each URL, and
+    pages that did not change are only counted as unchanged. Status, size and
+    stage timings of every page are summarized in a ScrapeRun.
+    :param urls: iterable of product URLs, defaults to every tracked URL
+    :param max_workers: number of concurrent fetches, defaults to SCRAPE_MAX_WORKERS
+    :param rate_per_host: requests per second per host, defaults to SCRAPE_RATE_PER_HOST
+    :param progress: optional callable(result, total) invoked after every saved URL
+    :param requests_per_minute: optional limit for all hosts together
+    :param batch_size: results written per transaction, defaults to SCRAPE_WRITE_BATCH_SIZE
+    :param metrics: optional ScrapeMetrics shared by several calls that form one run; the
+        caller saves it, and `run` of the result stays None
+    :return: RefreshResult with the number of updated, unchanged and failed URLs
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'SCRAPE_WRITE_BATCH_SIZE', 200)
+    if urls is not None:
+        urls = list(urls)
+    # Only the products and validators of the given URLs are loaded, so a
+    # small batch does not cost a read of the whole catalog.
+    validators = {v.product_url: v for v in _for_urls(PageValidator.objects.all(), urls)}
+    writer = RefreshWriter(batch_size, urls)
+    if urls is None:
+        urls = list(writer.catalog)
+    if max_workers is None:
+        max_workers = getattr(settings, 'SCRAPE_MAX_WORKERS', 8)
+    if rate_per_host is None:
+        rate_per_host = getattr(settings, 'SCRAPE_RATE_PER_HOST', 4)
+
+    total = len(urls)
+    limiters = [HostRateLimiter(rate_per_host)]
+    if requests_per_minute:
+        limiters.append(HostRateLimiter(requests_per_minute / 60.0, per_host=False))
+    result = RefreshResult()
+    save_metrics = metrics is None
+    if save_metrics:
+        metrics = ScrapeMetrics()
+    urls = iter(urls)
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Keep the queue short so a huge catalog does not pile up in memory.
+            while len(pending) < max_workers * 2:
+                url = next(urls, None)
+                if url is None:
+                    break
+                validator = validators.pop(url, None) or PageValidator(product_url=url)
+                page = PageStats(url)
+                future = executor.submit(_fetch, url, validator, limiters, page, writer.archive)
+                pending[future] = (url, validator, _validator_state(validator), page)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, validator, validator_state, page = pending.pop(future)
+                try:
+                    changed = writer.add(url, future.result(), validator, validator_state)
+                except Exception as e:
+                    result.failed += 1
+                    metrics.add(page, 'failed')
+                    print(f"Failed to update product from URL: {url} ({e})")
+                else:
+                    if changed:
+                        result.updated += 1
+                        metrics.add(page, 'updated')
+                        print(f"Updated product from URL: {url}")
+                    else:
+                        result.unchanged += 1
+                        metrics.add(page, 'unchanged')
+                        print(f"Product from URL: {url} is unchanged")
+                if progress is not None:
+                    progress(result, total)
+
+            if writer.full:
+                with timed(metrics, 'write_seconds'):
+                    writer.flush()
+
+    with timed(metrics, 'write_seconds'):
+        writer.flush(final=True)
+    if save_metrics:
+        result.run = metrics.save()
+    return result
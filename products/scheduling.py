@@ -0,0 +1,245 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from products.metrics import ScrapeMetrics
+from products.models import PriceHistory, Product, RefreshSchedule
+from products.refresh import RefreshResult, refresh_products
+
+
+def _interval_bounds():
+    return (
+        getattr(settings, 'REFRESH_MIN_INTERVAL', 3600),
+        getattr(settings, 'REFRESH_MAX_INTERVAL', 7 * 24 * 3600),
+    )
+
+
+def ensure_schedules(now=None):
+    """
+    Creates a schedule, due immediately, for every product that has none yet.
+    :return: number of created schedules
+    """
+    now = now or timezone.now()
+    min_interval, _ = _interval_bounds()
+    missing = Product.objects.filter(schedule__isnull=True).values_list('id', flat=True)
+    created = RefreshSchedule.objects.bulk_create(
+        (RefreshSchedule(product_id=product_id, interval=min_interval, next_due_at=now)
+         for product_id in missing.iterator()),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return len(created)
+
+
+def change_stats(product_ids, since):
+    """
+    Counts how often the price of products changed in their recent history.
+
+    History is only written when the price changes, but imports and backfills
+    can repeat a price, so every observation is compared with the one before
+    it, including the last observation before the period. A product observed
+    before the period is observed for the whole period.
+    :param product_ids: ids of the products
+    :param since: start of the history that is taken into account
+    :return: dict of product id -> (number of price changes, start of the observed period)
+    """
+    before = PriceHistory.objects.filter(product=OuterRef('pk'), timestamp__lt=since).order_by('-timestamp')
+    previous = dict(
+        Product.objects
+        .filter(id__in=product_ids)
+        .annotate(previous_price=Subquery(before.values('price')[:1]))
+        .filter(previous_price__isnull=False)
+        .values_list('id', 'previous_price')
+    )
+    rows = (
+        PriceHistory.objects
+        .filter(product_id__in=product_ids, timestamp__gte=since)
+        .order_by('product_id', 'timestamp')
+        .values_list('product_id', 'timestamp', 'price')
+    )
+
+    stats = {product_id: (0, since) for product_id in previous}
+    for product_id, timestamp, price in rows.iterator():
+        if product_id not in stats:
+            # The first observation of a product is not a change.
+            stats[product_id] = (0, timestamp)
+        elif price != previous[product_id]:
+            changes, first_seen = stats[product_id]
+            stats[product_id] = (changes + 1, first_seen)
+        previous[product_id] = price
+    return stats
+
+
+def next_interval(changes, observed_for, previous, min_interval, max_interval):
+    """
+    Derives the refresh interval of a page from its price-change frequency.
+
+    A page whose price changed is checked about twice per observed change, so
+    volatile products are refreshed often. A page without changes backs off
+    exponentially towards the maximum interval.
+    :param changes: number of price changes in the observed period
+    :param observed_for: length of the observed period in seconds
+    :param previous: current interval in seconds
+    :return: new interval in seconds, within [min_interval, max_interval]
+    """
+    if changes:
+        interval = observed_for / changes / 2
+    else:
+        interval = previous * 2
+    return int(min(max(interval, min_interval), max_interval))
+
+
+def reschedule(schedules, jitter=None):
+    """
+    Plans the next refresh of checked pages from their recent price changes
+    and releases their leases.
+    :param schedules: RefreshSchedule of the pages that were just refreshed
+    :param jitter: relative random spread of the next due time, defaults to REFRESH_JITTER
+    """
+    if jitter is None:
+        jitter = getattr(settings, 'REFRESH_JITTER', 0.1)
+    min_interval, max_interval = _interval_bounds()
+
+    checked_at = timezone.now()
+    lookback = timedelta(days=getattr(settings, 'REFRESH_LOOKBACK_DAYS', 30))
+    stats = change_stats([schedule.product_id for schedule in schedules], checked_at - lookback)
+
+    for schedule in schedules:
+        changes, first_seen = stats.get(schedule.product_id, (0, checked_at))
+        schedule.interval = next_interval(
+            changes, (checked_at - first_seen).total_seconds(), schedule.interval, min_interval, max_interval,
+        )
+        # Jitter keeps products added together from staying due together.
+        delay = schedule.interval * random.uniform(1 - jitter, 1 + jitter)
+        schedule.next_due_at = checked_at + timedelta(seconds=delay)
+        schedule.last_checked_at = checked_at
+        schedule.leased_until = None
+        schedule.leased_by = ''
+
+    RefreshSchedule.objects.bulk_update(
+        schedules, ['interval', 'next_due_at', 'last_checked_at', 'leased_until', 'leased_by'], batch_size=500,
+    )
+
+
+def run_due_refreshes(limit=None, requests_per_minute=None, jitter=None, now=None):
+    """
+    Refreshes the products whose schedule is due and plans their next refresh.
+    The due pages are claimed in leased batches of REFRESH_CLAIM_BATCH_SIZE,
+    like refresh workers do, so a long run never holds pages past their lease.
+    :param limit: maximum number of pages fetched in this run, most overdue first
+    :param requests_per_minute: global request budget, defaults to REFRESH_REQUESTS_PER_MINUTE
+    :param jitter: relative random spread of the next due time, defaults to REFRESH_JITTER
+    :param now: time the run starts, used to create missing schedules and count the pages still due
+    :return: (RefreshResult, number of products still due after this run)
+    """
+    now = now or timezone.now()
+    if requests_per_minute is None:
+        requests_per_minute = getattr(settings, 'REFRESH_REQUESTS_PER_MINUTE', 60)
+
+    ensure_schedules(now)
+    # Claiming leases keeps the run from fetching pages that refresh workers hold.
+    result = run_refresh_worker(
+        'refresh_due_products', requests_per_minute=requests_per_minute, limit=limit, jitter=jitter,
+    )
+    return result, RefreshSchedule.objects.filter(next_due_at__lte=now).count()
+
+
+def claim_due_schedules(worker, batch_size, lease_seconds=None, now=None):
+    """
+    Leases a batch of due pages to a refresh worker.
+
+    Pages leased by another worker are skipped until the lease expires, so
+    concurrent workers never fetch the same page, and the pages of a worker
+    that died are picked up again after `lease_seconds`. PostgreSQL skips
+    rows locked by a concurrent claim with SELECT ... FOR UPDATE SKIP LOCKED;
+    SQLite selects and updates in one BEGIN IMMEDIATE transaction, which holds
+    the write lock.
+    :param worker: name of the worker, stored with the lease
+    :param batch_size: maximum number of pages to claim, most overdue first
+    :param lease_seconds: lease duration, defaults to REFRESH_LEASE_SECONDS
+    :return: list of claimed RefreshSchedule with their product URL loaded
+    """
+    now = now or timezone.now()
+    if lease_seconds is None:
+        lease_seconds = getattr(settings, 'REFRESH_LEASE_SECONDS', 600)
+    # A token per claim tells the rows of this claim apart from older leases of the same worker.
+    token = f'{worker}:{uuid.uuid4().hex[:12]}'[-64:]
+    lease = {'leased_until': now + timedelta(seconds=lease_seconds), 'leased_by': token}
+
+    available = RefreshSchedule.objects.filter(
+        Q(leased_until__isnull=True) | Q(leased_until__lt=now), next_due_at__lte=now,
+    )
+    candidates = available.order_by('next_due_at').values_list('pk', flat=True)[:batch_size]
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates)
+        available.filter(pk__in=ids).update(**lease)
+
+    # Read back by primary key; the token drops rows another claim took in between.
+    return list(
+        RefreshSchedule.objects.filter(pk__in=ids, leased_by=token)
+        .select_related('product')
+        .only('product__product_url', 'interval', 'next_due_at')
+    )
+
+
+def run_refresh_worker(worker, batch_size=None, lease_seconds=None, requests_per_minute=None, rate_per_host=None,
+                       max_batches=None, report=None, limit=None, jitter=None):
+    """
+    Claims and refreshes batches of due pages until none are left.
+    Several workers, in separate processes or on separate hosts, share the
+    due pages through their leases.
+    :param worker: name of the worker
+    :param batch_size: pages per claim, defaults to REFRESH_CLAIM_BATCH_SIZE
+    :param lease_seconds: lease duration, defaults to REFRESH_LEASE_SECONDS, or to twice the time
+        a batch takes at `requests_per_minute` when that is longer
+    :param requests_per_minute: request budget of this worker, None for no limit
+    :param rate_per_host: requests per second per host of this worker
+    :param max_batches: optional limit of claimed batches
+    :param report: optional callable(result, batch) invoked after every batch
+    :param limit: optional limit of fetched pages
+    :param jitter: relative random spread of the next due time, defaults to REFRESH_JITTER
+    :return: RefreshResult summed over all batches, with the ScrapeRun of the worker
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'REFRESH_CLAIM_BATCH_SIZE', 50)
+    if lease_seconds is None:
+        lease_seconds = getattr(settings, 'REFRESH_LEASE_SECONDS', 600)
+        if requests_per_minute:
+            # A batch must be fetched before its lease expires, however small the request budget.
+            lease_seconds = max(lease_seconds, 2 * batch_size * 60 / requests_per_minute)
+    total = RefreshResult()
+    # All batches of the worker are stored as one ScrapeRun.
+    metrics = ScrapeMetrics()
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        size = batch_size if limit is None else min(batch_size, limit - total.total)
+        if size <= 0:
+            break
+        schedules = claim_due_schedules(worker, size, lease_seconds)
+        if not schedules:
+            break
+        result = refresh_products(
+            [schedule.product.product_url for schedule in schedules],
+            requests_per_minute=requests_per_minute,
+            rate_per_host=rate_per_host,
+            metrics=metrics,
+        )
+        reschedule(schedules, jitter)
+
+        total.updated += result.updated
+        total.unchanged += result.unchanged
+        total.failed += result.failed
+        batches += 1
+        if report is not None:
+            report(result, batches)
+    total.run = metrics.save()
+    return total
@@ -0,0 +1,161 @@
+import re
+
+from django.db import connection
+from django.db.models import Min, Q
+
+from products.models import Product
+
+FTS_TABLE = 'products_product_fts'
+
+# The search index is a shadow of products_product kept in sync by triggers,
+# so queryset.update() and bulk_create() keep it current as well. A SQLite
+# table rebuild during a migration drops the triggers, which is why they are
+# recreated after every migrate (see ProductsConfig.ready).
+SQLITE_INDEX_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='products_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+POSTGRES_DOCUMENT = "to_tsvector('simple', coalesce(p.name, '') || ' ' || coalesce(p.description, ''))"
+
+POSTGRES_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS product_search_idx ON products_product USING gin ("
+    + POSTGRES_DOCUMENT.replace('p.', '')
+    + ")",
+]
+
+
+def ensure_search_index(using=connection, rebuild=False):
+    """
+    Creates the full-text index of the products and its sync triggers if missing.
+    :param using: database connection
+    :param rebuild: repopulate the SQLite index from products_product
+    """
+    if using.vendor == 'sqlite':
+        statements = list(SQLITE_INDEX_SQL)
+        if rebuild:
+            statements.append(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif using.vendor == 'postgresql':
+        statements = POSTGRES_INDEX_SQL
+    else:
+        return
+
+    with using.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_search_index(using=connection):
+    """Removes the full-text index created by ensure_search_index."""
+    if using.vendor == 'sqlite':
+        statements = [f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}" for suffix in ('ai', 'ad', 'au')]
+        statements.append(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif using.vendor == 'postgresql':
+        statements = ["DROP INDEX IF EXISTS product_search_idx"]
+    else:
+        return
+
+    with using.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class SearchResults:
+    """
+    Ranked full-text matches with one product per name, paginated in the database.
+    Supports count() and slicing, so it can be passed to a Paginator.
+    """
+
+    def __init__(self, query):
+        self.terms = _terms(query)
+
+        if connection.vendor == 'sqlite':
+            self.params = [' '.join(f'"{term}"*' for term in self.terms)]
+            # Name matches weigh ten times more than description matches.
+            # bm25() cannot be used inside an aggregate, so the ranking is
+            # materialized before the per-name grouping.
+            self.matches = f"""
+                WITH ranked AS MATERIALIZED (
+                    SELECT rowid, bm25({FTS_TABLE}, 10.0, 1.0) AS score
+                    FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+                )
+                SELECT p.*, MIN(ranked.score) AS score
+                FROM ranked JOIN products_product p ON p.id = ranked.rowid
+                GROUP BY p.name
+            """
+            self.order = 'ORDER BY score, name'
+        else:
+            self.params = [' & '.join(f'{term}:*' for term in self.terms)]
+            self.matches = f"""
+                SELECT DISTINCT ON (p.name) p.*, -ts_rank({POSTGRES_DOCUMENT}, q) AS score
+                FROM products_product p, to_tsquery('simple', %s) q
+                WHERE {POSTGRES_DOCUMENT} @@ q
+                ORDER BY p.name, score
+            """
+            self.order = 'ORDER BY score, name'
+
+    def count(self):
+        if not self.terms:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM ({self.matches}) matches', self.params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.terms:
+            return []
+
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        sql = f'SELECT * FROM ({self.matches}) matches {self.order} LIMIT %s OFFSET %s'
+        return list(Product.objects.raw(sql, self.params + [stop - start, start]))
+
+
+def search_products(query):
+    """
+    Searches products by name and description.
+    :param query: search text; an empty query returns every product name once
+    :return: sliceable results with count(), ordered by relevance
+    """
+    if not query or not _terms(query):
+        first_per_name = Product.objects.values('name').annotate(first_id=Min('id')).values('first_id')
+        return Product.objects.filter(id__in=first_per_name).order_by('name', 'id')
+
+    if connection.vendor in ('sqlite', 'postgresql'):
+        return SearchResults(query)
+
+    matching = Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+    first_per_name = matching.values('name').annotate(first_id=Min('id')).values('first_id')
+    return Product.objects.filter(id__in=first_per_name).order_by('name', 'id')
@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+BUCKETS = ('day', 'week')
+
+
+def lttb(points, threshold):
+    """
+    Downsamples a series with the Largest-Triangle-Three-Buckets algorithm,
+    which keeps the visual shape (peaks and drops) of the chart.
+    :param points: list of (x, y, ...) tuples ordered by x
+    :param threshold: maximum number of points to return
+    :return: list with at most `threshold` of the original points
+    """
+    size = len(points)
+    if threshold >= size or threshold < 3:
+        return points
+
+    sampled = [points[0]]
+    every = (size - 2) / (threshold - 2)
+    selected = 0
+
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, size)
+        avg_range = points[avg_start:avg_end]
+        avg_x = sum(point[0] for point in avg_range) / len(avg_range)
+        avg_y = sum(point[1] for point in avg_range) / len(avg_range)
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        selected_x, selected_y = points[selected][0], points[selected][1]
+
+        max_area = -1
+        next_selected = range_start
+        for j in range(range_start, range_end):
+            area = abs(
+                (selected_x - avg_x) * (points[j][1] - selected_y)
+                - (selected_x - points[j][0]) * (avg_y - selected_y)
+            )
+            if area > max_area:
+                max_area = area
+                next_selected = j
+
+        sampled.append(points[next_selected])
+        selected = next_selected
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def _bucket_start(timestamp, bucket):
+    day = timezone.localtime(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'week':
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def bucket_rows(rows, bucket):
+    """
+    Aggregates observations into day or week buckets.
+    :param rows: iterable of (timestamp, price) ordered by timestamp
+    :param bucket: 'day' or 'week'
+    :return: generator of (bucket start, min price, max price, last price)
+    """
+    current = None
+
+    for timestamp, price in rows:
+        start = _bucket_start(timestamp, bucket)
+        if current is None or current[0] != start:
+            if current is not None:
+                yield tuple(current)
+            current = [start, price, price, price]
+        else:
+            current[1] = min(current[1], price)
+            current[2] = max(current[2], price)
+            current[3] = price
+
+    if current is not None:
+        yield tuple(current)
+
+
+def _history_rows(product, since):
+    history = product.price_history.order_by('timestamp')
+    if since is not None:
+        history = history.filter(timestamp__gt=since)
+    return history.values_list('timestamp', 'price')
+
+
+def build_series(rows, since=None, bucket=None, points=None):
+    """
+    Turns observations into chart series, see load_series.
+    :param rows: iterable of (timestamp, price) ordered by timestamp
+    """
+    if bucket:
+        series = [(start.timestamp(), last, start, low, high) for start, low, high, last in bucket_rows(rows, bucket)]
+    else:
+        series = [(timestamp.timestamp(), price, timestamp) for timestamp, price in rows]
+
+    if points:
+        series = lttb(series, points)
+
+    data = {
+        'timestamps': [point[2].isoformat() for point in series],
+        'labels': [point[2].strftime('%d.%m.%Y') for point in series],
+        'prices': [point[1] for point in series],
+        'cursor': series[-1][2].isoformat() if series else (since.isoformat() if since else None),
+    }
+    if bucket:
+        data['min'] = [point[3] for point in series]
+        data['max'] = [point[4] for point in series]
+    return data
+
+
+def load_series(product, since=None, bucket=None, points=None):
+    """
+    Loads the price history of a product as chart series.
+    :param product: Product
+    :param since: only observations after this datetime are returned
+    :param bucket: None for raw observations, or 'day'/'week' for min/max/last per bucket
+    :param points: maximum number of points, downsampled with LTTB
+    :return: dict with timestamps, labels, prices and, when bucketed, min and max series
+    """
+    return build_series(_history_rows(product, since).iterator(), since, bucket, points)
+
+
+async def aload_series(product, since=None, bucket=None, points=None):
+    """Async version of load_series for async views."""
+    # aiterator() would run the values_list query in the event loop thread.
+    rows = [row async for row in _history_rows(product, since)]
+    return build_series(rows, since, bucket, points)
@@ -1,19 +1,23 @@
+from django.conf import settings
+from django.db import connections
+from .observations import record_observations
+from .search import ensure_search_index
 
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
-from .models import Product, PriceHistory
 
-
-@receiver(pre_save, sender=Product)
 def save_price_history(sender, instance, **kwargs):
-    if instance.pk:  # Только для существующих продуктов (не для новых)
-        try:
-            old_instance = Product.objects.get(pk=instance.pk)
+    """
+    Records the price of a saved product if it changed. Only active with
+    PRICE_HISTORY_ON_SAVE; the scraping code records prices in batches itself.
+    """
+    if getattr(settings, 'PRICE_HISTORY_ON_SAVE', False) and instance.price is not None:
+        record_observations([(instance, instance.price, None)], only_changes=True)
+
 
-            if old_instance.price != instance.price:
-                PriceHistory.objects.create(
-                    product=instance,
-                    price=instance.price
-                )
-        except Product.DoesNotExist:
-            pass
\ No newline at end of file
+def restore_search_index(sender, using, **kwargs):
+    """
+    Recreates the search index triggers after migrate: SQLite drops them
+    whenever a migration rebuilds the products_product table.
+    """
+    connection = connections[using]
+    if 'products_product' in connection.introspection.table_names():
+        ensure_search_index(connection)
@@ -0,0 +1,182 @@
+"""
+Local stand-in for tweakers.net pricewatch pages, used by the tests and by
+`manage.py benchmark_refresh` to exercise the scrape path without the network.
+
+Every path of the form /pricewatch/<number>/<anything> serves a synthetic
+product page with the markup the extractors read. Pages can be slowed down,
+fail at random, answer conditional requests with 304 and change their price
+over time.
+"""
+import hashlib
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="nl">
+<head><meta charset="utf-8"><title>{name} - Pricewatch - Tweakers</title></head>
+<body>
+<div class="gallery-trigger"><img src="https://tweakers.net/ext/i/{number}.jpg" alt="{name}"></div>
+<h1 class="line-clamp">{name}</h1>
+<div class="shop-listing">
+  <a class="price" href="https://tweakers.net/clickout/{number}/">
+    <span class="lowest-price">€ {price}</span>
+  </a>
+  <span class="ellipsis">Shop {shop}</span>
+</div>
+<div class="specs">
+  <div class="spec-content spec-line"><a class="line-clamp" href="/pricewatch/{number}/specs/">Model {number}, {storage} GB</a></div>
+  <div class="spec-content spec-line"><span>Kleur: zwart</span></div>
+</div>
+{filler}
+</body>
+</html>
+"""
+
+FILLER_BLOCK = '<div class="listing-row"><span class="label">Specificatie</span><span class="value">Waarde</span></div>\n'
+
+
+def format_euro(value):
+    """Formats a price the way tweakers.net does: 1.099,00"""
+    whole, cents = f'{value:.2f}'.split('.')
+    return f'{int(whole):,}'.replace(',', '.') + ',' + cents
+
+
+class StandInState:
+    """
+    Prices and versions of the served pages, shared by the request threads.
+    :param drift: probability that a request finds the price of the page changed
+    :param seed: random seed, for reproducible prices
+    """
+
+    def __init__(self, drift=0.0, seed=None):
+        self.drift = drift
+        self.random = random.Random(seed)
+        self.pages = {}
+        self.lock = threading.Lock()
+
+    def page(self, number):
+        """
+        :return: tuple (price, version, modified timestamp) of the page
+        """
+        with self.lock:
+            state = self.pages.get(number)
+            if state is None:
+                price = round(random.Random(number).uniform(20, 2000), 2)
+                state = (price, 1, time.time())
+            elif self.drift and self.random.random() < self.drift:
+                price, version, _ = state
+                price = round(max(1.0, price * self.random.uniform(0.9, 1.1)), 2)
+                state = (price, version + 1, time.time())
+            self.pages[number] = state
+            return state
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+
+        parts = self.path.strip('/').split('/')
+        if len(parts) < 3 or parts[0] != 'pricewatch' or not parts[1].isdigit():
+            return self._respond(404, b'not found')
+        if server.error_rate and random.random() < server.error_rate:
+            return self._respond(server.error_status, b'error')
+
+        number = int(parts[1])
+        price, version, modified = server.state.page(number)
+        etag = '"%s"' % hashlib.md5(f'{number}:{version}'.encode()).hexdigest()
+        headers = {'ETag': etag, 'Last-Modified': formatdate(modified, usegmt=True)}
+
+        if self.headers.get('If-None-Match') == etag:
+            return self._respond(304, b'', headers)
+
+        body = PAGE_TEMPLATE.format(
+            number=number,
+            name=f'Stand-in Product {number}',
+            price=format_euro(price),
+            shop=number % 7,
+            storage=64 * (1 + number % 8),
+            filler=FILLER_BLOCK * server.filler_blocks,
+        ).encode()
+        self._respond(200, body, headers)
+
+    def _respond(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server serving synthetic pricewatch pages.
+    :param port: port on 127.0.0.1, 0 picks a free one
+    :param latency: mean delay per request in seconds
+    :param error_rate: share of requests answered with `error_status`
+    :param error_status: status of failed requests
+    :param drift: probability that a request finds a changed price
+    :param page_kb: approximate size of a page in kilobytes
+    :param seed: random seed for the price drift
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, error_status=503, drift=0.0, page_kb=100,
+                 seed=None):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.state = StandInState(drift, seed)
+        self.filler_blocks = max(0, page_kb * 1024 // len(FILLER_BLOCK))
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def url(self, number):
+        return f'{self.base_url}/pricewatch/{number}/stand-in-product-{number}.html'
+
+    def start(self):
+        """Serves requests in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def serve(options, ready=None):
+    """
+    Runs a StandInServer until the process is terminated, for use as the
+    target of a separate process.
+    :param options: keyword arguments of StandInServer
+    :param ready: optional queue that receives the base URL once the server listens
+    """
+    server = StandInServer(**options)
+    if ready is not None:
+        ready.put(server.base_url)
+    server.serve_forever()
@@ -1,3 +1,938 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products.alerts import deliver_alerts
+from products.archive import GZIP, PageArchive, decompress, prune_archive
+from products.extractors import EXTRACTORS, get_extractor
+from products.jobs import ADD_PRODUCTS, REFRESH, aenqueue_job, enqueue_job, run_pending_jobs
+from products.maintenance import backfill_price_history, delete_products_in_batches
+from products.models import (
+    AlertDelivery, AlertRule, Job, PageBlob, PageSnapshot, PageValidator, PriceHistory, PriceSummary, Product,
+    RefreshSchedule, ScrapeRun,
+)
+from products.observations import rebuild_summaries, record_observations
+from products.reextract import reextract
+from products.refresh import refresh_products
+from products.scheduling import (
+    change_stats, claim_due_schedules, ensure_schedules, next_interval, reschedule, run_due_refreshes,
+    run_refresh_worker,
+)
+from products.standin import StandInServer
+from products import transfer
+from products.transfer import export_history, import_history, read_history
+
+PRODUCT_URL = 'https://tweakers.net/pricewatch/{}/product.html'
+
+
+def create_products(count, observations=3, start=0):
+    """Creates `count` tracked products with a few price observations each."""
+    products = Product.objects.bulk_create(
+        Product(name=f'Product {i:05d}', price=100 + i, product_url=PRODUCT_URL.format(i))
+        for i in range(start, start + count)
+    )
+    PriceHistory.objects.bulk_create(
+        PriceHistory(product=product, price=product.price + n)
+        for product in products
+        for n in range(observations)
+    )
+    rebuild_summaries()
+    return products
+
+
+class CatalogTestCase(TestCase):
+    """Starts every test with an empty cache, which is not rolled back with the database."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class ViewQueryCountTests(CatalogTestCase):
+    """Query counts of the views must not grow with the size of the catalog."""
+
+    def test_product_list(self):
+        # One query for the catalog version, two for the page.
+        create_products(3)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('product_list'))
+
+        create_products(30, start=3)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('product_list'))
+        self.assertEqual(len(response.context['products']), 9)
+
+    def test_product_detail(self):
+        product = create_products(1, observations=50)[0]
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('product_detail', args=[product.pk]))
+        self.assertEqual(len(response.context['price_history_labels'].split(',')), 50)
+
+    def test_add_product_duplicate(self):
+        product = create_products(1)[0]
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('add_product'), {'url': product.product_url})
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch('products.utils.get_link_data')
+    def test_add_product(self, get_link_data):
+        url = PRODUCT_URL.format('new')
+        get_link_data.return_value = ('New', '10', '', url, 'Shop', '', '')
+
+        response = self.client.post(reverse('add_product'), {'url': url})
+
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.pk]))
+        get_link_data.assert_not_called()
+
+        run_pending_jobs()
+        product = Product.objects.get(product_url=url)
+        status = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual(status['status'], Job.DONE)
+        self.assertEqual(status['redirect_url'], reverse('product_detail', args=[product.pk]))
+        self.assertEqual(list(product.price_history.values_list('price', flat=True)), [10.0])
+
+    def test_delete_product(self):
+        product = create_products(2, observations=20)[0]
+        with self.assertNumQueries(13):
+            self.client.post(reverse('delete_product', args=[product.pk]))
+
+        self.assertFalse(Product.objects.filter(pk=product.pk).exists())
+        self.assertFalse(PriceHistory.objects.filter(product_id=product.pk).exists())
+        self.assertEqual(PriceHistory.objects.count(), 20)
+
+    def test_search_results(self):
+        create_products(30)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('search_results'), {'q': 'Product'})
+        self.assertEqual(len(response.context['products']), 20)
+
+
+class PageCacheTests(CatalogTestCase):
+    def test_pages_are_cached_until_the_catalog_changes(self):
+        products = create_products(2)
+        url = reverse('product_list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), products[1].name)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+            )
+
+        self.client.post(reverse('delete_product', args=[products[1].pk]))
+        # The flash message of the delete is not served from the cache.
+        self.assertContains(self.client.get(url), 'Deleted product')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertNotContains(response, products[1].name)
+
+
+class ApiTests(CatalogTestCase):
+    def post_json(self, name, data):
+        return self.client.post(reverse(name), json.dumps(data), content_type='application/json')
+
+    def test_product_list_cursor_pagination(self):
+        products = create_products(5)
+        # Equal timestamps are ordered by id, so no product is skipped or repeated.
+        Product.objects.update(timestamp=timezone.now())
+
+        seen, cursor = [], ''
+        while cursor is not None:
+            with self.assertNumQueries(2):
+                page = self.client.get(reverse('api_product_list'), {'limit': 2, 'cursor': cursor}).json()
+            seen += [row['id'] for row in page['results']]
+            cursor = page['next_cursor']
+            cache.clear()
+
+        self.assertEqual(seen, [product.pk for product in reversed(products)])
+        self.assertEqual(page['results'][-1]['max_price'], products[0].price + 2)
+        self.assertEqual(self.client.get(reverse('api_product_list'), {'cursor': 'x'}).status_code, 400)
+
+    def test_history_since(self):
+        product = create_products(1, observations=0)[0]
+        start = timezone.now()
+        for minutes in range(4):
+            record_observations([(product.pk, 10 + minutes, start + timedelta(minutes=minutes))])
+
+        url = reverse('api_product_history', args=[product.pk])
+        response = self.client.get(url, {'since': (start + timedelta(minutes=1)).isoformat()})
+        self.assertEqual([row['price'] for row in response.json()['results']], [12.0, 13.0])
+
+        for since in ('yesterday', '2024-13-01T00:00'):
+            response = self.client.get(url, {'since': since})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'since must be an ISO 8601 datetime'})
+
+    def test_bulk_add_and_delete(self):
+        existing = create_products(2)
+        new_url = PRODUCT_URL.format('new')
+
+        response = self.post_json('api_bulk_add', {'urls': [existing[0].product_url, new_url, 'https://example.com/']})
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual((data['queued'], data['existing']), ([new_url], [existing[0].product_url]))
+        self.assertEqual(list(data['invalid']), ['https://example.com/'])
+        self.assertEqual(Job.objects.get(pk=data['job']['id']).kind, ADD_PRODUCTS)
+
+        response = self.post_json('api_bulk_delete', {'urls': [product.product_url for product in existing] + [new_url]})
+        self.assertEqual(response.json(), {'deleted': 2, 'not_found': [new_url]})
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(self.client.post(reverse('api_bulk_delete'), {'urls': new_url}).status_code, 400)
+
+
+class JobQueueTests(CatalogTestCase):
+    def test_concurrent_refreshes_share_one_job(self):
+        first = self.client.post(reverse('update_product'))
+        second = self.client.post(reverse('update_product'))
+        self.assertEqual(first.url, second.url)
+        self.assertEqual(Job.objects.filter(kind=REFRESH).count(), 1)
+        self.assertTemplateUsed(self.client.get(reverse('update_product')), 'products/update_confirm.html')
+
+    async def test_async_enqueue_and_status(self):
+        job, created = await aenqueue_job(REFRESH, dedupe_key=REFRESH)
+        self.assertTrue(created)
+        self.assertEqual(await aenqueue_job(REFRESH, dedupe_key=REFRESH), (job, False))
+
+        response = await self.async_client.get(reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.json()['status'], Job.QUEUED)
+
+    @mock.patch('products.refresh.get_link_data')
+    def test_refresh_job_reports_progress(self, get_link_data):
+        products = create_products(3)
+        get_link_data.return_value = None
+
+        job, _ = enqueue_job(REFRESH, dedupe_key=REFRESH)
+        self.assertEqual(run_pending_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total), (Job.DONE, 3, 3))
+        self.assertEqual(job.result['unchanged'], len(products))
+        # A finished job no longer blocks a new refresh.
+        self.assertTrue(enqueue_job(REFRESH, dedupe_key=REFRESH)[1])
+
+    @mock.patch('products.utils.get_link_data', side_effect=ValueError('page not found'))
+    def test_failed_job(self, get_link_data):
+        self.client.post(reverse('add_product'), {'url': PRODUCT_URL.format('missing')})
+        run_pending_jobs()
+
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.error), (Job.FAILED, 'page not found'))
+        self.assertFalse(Product.objects.exists())
+
+    def test_failed_fetch_adds_no_product(self):
+        response = requests.Response()
+        response.status_code = 404
+        self.client.post(reverse('add_product'), {'url': PRODUCT_URL.format('gone')})
+        with mock.patch.object(requests.Session, 'get', return_value=response):
+            run_pending_jobs()
+
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.error), (Job.FAILED, 'no product data found on the page'))
+        self.assertFalse(Product.objects.exists())
+        self.assertIsNone(self.client.get(reverse('job_status', args=[job.pk])).json()['redirect_url'])
+
+
+class RefreshWriteTests(CatalogTestCase):
+    def page_data(self, url):
+        product = Product.objects.get(product_url=url)
+        price = '999' if product.name.endswith('1') else str(product.price)
+        return product.name, price, product.photo_url, url, product.supplier, product.supplier_url, product.description
+
+    @mock.patch('products.refresh.get_link_data')
+    def test_only_changes_are_written(self, get_link_data):
+        products = create_products(3)
+        pages = {product.product_url: self.page_data(product.product_url) for product in products}
+        pages[products[2].product_url] = None
+        get_link_data.side_effect = lambda url, validator, archive: pages[url]
+
+        result = refresh_products(max_workers=2, rate_per_host=0)
+
+        self.assertEqual((result.updated, result.unchanged, result.failed), (1, 2, 0))
+        self.assertEqual(PriceHistory.objects.count(), 3 * 3 + 1)
+        self.assertEqual(Product.objects.get(pk=products[1].pk).price, 999.0)
+        self.assertEqual(PriceSummary.objects.get(product=products[1]).current_price, 999.0)
+        self.assertEqual(PageValidator.objects.exclude(checked_at=None).count(), 3)
+
+    @mock.patch('products.refresh.get_link_data', return_value=None)
+    def test_writes_are_batched(self, get_link_data):
+        # Unchanged pages cost one UPDATE per batch, whatever the catalog size.
+        create_products(10)
+        refresh_products(max_workers=2, rate_per_host=0)
+        # The last four queries store the ScrapeRun and add it to the counters in a savepoint.
+        with self.assertNumQueries(9):
+            refresh_products(max_workers=2, rate_per_host=0, batch_size=100)
+
+        create_products(40, start=10)
+        refresh_products(max_workers=2, rate_per_host=0)
+        with self.assertNumQueries(9):
+            refresh_products(max_workers=2, rate_per_host=0, batch_size=100)
+
+    @mock.patch('products.refresh.get_link_data', return_value=None)
+    def test_given_urls_do_not_load_the_catalog(self, get_link_data):
+        products = create_products(30)
+        refresh_products(max_workers=2, rate_per_host=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_products([product.product_url for product in products[:3]], max_workers=2, rate_per_host=0)
+        # The same queries as a refresh of the whole catalog, but every SELECT is filtered by URL.
+        self.assertEqual(len(queries), 9)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 2)
+        for sql in selects:
+            self.assertIn('"product_url" IN', sql)
+
+
+class AlertTests(CatalogTestCase):
+    def refresh(self, product, price):
+        data = (product.name, str(price), '', product.product_url, 'Shop', '', '')
+        with mock.patch('products.refresh.get_link_data', return_value=data):
+            refresh_products([product.product_url], rate_per_host=0)
+
+    def test_rules_fire_once_per_crossing(self):
+        product = create_products(1)[0]  # current and highest price 102
+        for kind, threshold in ((AlertRule.BELOW, 95), (AlertRule.DROP, 10)):
+            response = self.client.post(
+                reverse('api_create_alert', args=[product.pk]),
+                json.dumps({'kind': kind, 'threshold': threshold, 'email': 'me@example.com'}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertFalse(response.json()['triggered'])
+
+        self.refresh(product, 90)
+        self.refresh(product, 85)
+        self.assertEqual(AlertDelivery.objects.count(), 2)
+
+        # Back above both thresholds re-arms the rules, the next drop fires again.
+        self.refresh(product, 120)
+        self.refresh(product, 94)
+        self.assertEqual(
+            sorted(AlertDelivery.objects.values_list('rule__kind', 'price')),
+            [('below', 90.0), ('below', 94.0), ('drop', 90.0), ('drop', 94.0)],
+        )
+
+        self.assertEqual(deliver_alerts(batch_size=3), (4, 0))
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(deliver_alerts(), (0, 0))
+
+    def test_invalid_rule(self):
+        product = create_products(1)[0]
+        response = self.client.post(
+            reverse('api_create_alert', args=[product.pk]),
+            json.dumps({'kind': 'drop', 'threshold': 150, 'email': 'me@example.com'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('threshold', response.json()['fields'])
+
+
+class ScrapePathTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = StandInServer(page_kb=5, seed=1).start()
+        self.addCleanup(self.server.stop)
+        self.urls = [self.server.url(number) for number in range(3)]
+        Product.objects.bulk_create(Product(product_url=url) for url in self.urls)
+
+    def test_extractors_agree_on_stand_in_pages(self):
+        page = requests.get(self.urls[0]).text
+        fields = {name: get_extractor(name).extract(page) for name in EXTRACTORS}
+        self.assertEqual(set(fields.values()), {fields['soup']})
+        self.assertEqual(fields['soup'][0], 'Stand-in Product 0')
+
+    @skipUnless('lxml' in EXTRACTORS, 'lxml is not installed')
+    def test_default_parser_is_lxml(self):
+        with override_settings():
+            del settings.SCRAPE_PARSER
+            self.assertEqual(get_extractor().name, 'lxml')
+
+    def test_refresh_against_stand_in(self):
+        result = refresh_products(self.urls, rate_per_host=0)
+        self.assertEqual((result.updated, result.failed), (3, 0))
+        product = Product.objects.get(product_url=self.urls[1])
+        self.assertEqual(product.name, 'Stand-in Product 1')
+        self.assertEqual(product.price, self.server.state.page(1)[0])
+
+        # Unchanged pages answer the conditional requests with 304.
+        result = refresh_products(self.urls, rate_per_host=0)
+        self.assertEqual(result.unchanged, 3)
+        self.assertEqual(result.run.status_counts, {'304': 3})
+
+        self.server.state.drift = 1.0
+        result = refresh_products(self.urls, rate_per_host=0)
+        self.assertEqual(result.updated, 3)
+        self.assertEqual(PriceHistory.objects.count(), 6)
+
+        self.server.error_rate, self.server.error_status = 1.0, 404
+        result = refresh_products(self.urls, rate_per_host=0)
+        self.assertEqual((result.failed, result.run.status_counts), (3, {'404': 3}))
+
+    @override_settings(PAGE_ARCHIVE=True)
+    def test_reextract_backfills_from_the_archive(self):
+        refresh_products(self.urls, rate_per_host=0)
+        # Pages answered with 304 are not archived again.
+        refresh_products(self.urls, rate_per_host=0)
+        self.assertEqual(PageSnapshot.objects.count(), 3)
+        blob = PageBlob.objects.get(snapshots__product__product_url=self.urls[1])
+        self.assertLess(len(blob.data), blob.size)
+
+        # A markup change left the catalog without names and prices.
+        Product.objects.update(name='', price=None)
+        with mock.patch.object(requests.Session, 'get', side_effect=AssertionError('no network')):
+            result = reextract(workers=2, batch_size=2)
+        self.assertEqual((result.updated, result.failed), (3, 0))
+        product = Product.objects.get(product_url=self.urls[1])
+        self.assertEqual(product.name, 'Stand-in Product 1')
+        self.assertEqual(product.price, self.server.state.page(1)[0])
+        # The price equals the last observation, so the history is unchanged.
+        self.assertEqual(PriceHistory.objects.count(), 3)
+        self.assertEqual(reextract(only_missing=True).total, 0)
+        for since in ('yesterday', '2024-13-01'):
+            with self.assertRaisesMessage(CommandError, '--since must be an ISO 8601 date or datetime.'):
+                call_command('reextract', since=since)
+
+    def test_archive_deduplicates_page_bodies(self):
+        products = Product.objects.order_by('id')
+        archive = PageArchive(codec=GZIP)
+        for url in self.urls[:2]:
+            archive.add(url, '<html>Same page</html>')
+        archive.add('https://tweakers.net/pricewatch/new/', '<html>Not a product yet</html>')
+        product_ids = dict(products.values_list('product_url', 'id'))
+        self.assertEqual(archive.flush(product_ids.get), 2)
+
+        blob = PageBlob.objects.get()
+        self.assertEqual(decompress(blob.codec, blob.data), b'<html>Same page</html>')
+        self.assertEqual(len(archive._pages), 1)
+        # The page of a URL that never got a product is dropped by the final flush.
+        self.assertEqual(archive.flush(product_ids.get, final=True), 0)
+        self.assertEqual((archive._pages, archive.skipped), ([], 1))
+
+        products.filter(product_url=self.urls[0]).delete()
+        self.assertEqual(prune_archive(timezone.now()), (0, 0))
+        products.delete()
+        self.assertEqual(prune_archive(timezone.now()), (0, 1))
+
+
+class ScrapeMetricsTests(CatalogTestCase):
+    def response(self, body, status=200):
+        response = requests.Response()
+        response.status_code = status
+        response._content = body
+        return response
+
+    def test_refresh_records_a_scrape_run(self):
+        page = (Path(__file__).parent / 'testdata' / 'pages' / 'product_1.html').read_bytes()
+        responses = {
+            PRODUCT_URL.format('ok'): self.response(page),
+            PRODUCT_URL.format('empty'): self.response(b'<html><body></body></html>'),
+            PRODUCT_URL.format('gone'): self.response(b'', status=404),
+        }
+        with mock.patch.object(requests.Session, 'get', side_effect=lambda url, **kwargs: responses[url]):
+            result = refresh_products(list(responses), max_workers=2, rate_per_host=0)
+
+        run = ScrapeRun.objects.get()
+        self.assertEqual(result.run, run)
+        self.assertEqual((run.pages, run.updated, run.failed), (3, 1, 2))
+        self.assertEqual(run.status_counts, {'200': 2, '404': 1})
+        self.assertEqual(run.bytes, len(page) + 26)
+        self.assertEqual(run.selector_misses['price'], 1)
+        self.assertGreater(run.parse_seconds, 0)
+        self.assertEqual(len(run.slowest_pages), 3)
+
+        response = self.client.get(reverse('scrape_metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('tweakers_scrape_pages_total{outcome="failed"} 2', response.content.decode())
+        self.assertIn('tweakers_scrape_last_run_responses{status="404"} 1', response.content.decode())
+
+        # Counters do not go down when runs are deleted.
+        ScrapeRun.objects.all().delete()
+        metrics = self.client.get(reverse('scrape_metrics')).content.decode()
+        self.assertIn('tweakers_scrape_runs_total 1', metrics)
+        self.assertIn('tweakers_scrape_pages_total{outcome="failed"} 2', metrics)
+
+    @override_settings(PAGE_ARCHIVE=True)
+    def test_pages_of_failed_additions_are_not_kept(self):
+        page = (Path(__file__).parent / 'testdata' / 'pages' / 'product_1.html').read_bytes()
+        responses = {
+            PRODUCT_URL.format('ok'): self.response(page),
+            PRODUCT_URL.format('empty'): self.response(b'<html><body></body></html>'),
+        }
+        archives, flush = [], PageArchive.flush
+
+        def record_flush(archive, product_id, final=False):
+            archives.append(archive)
+            return flush(archive, product_id, final=final)
+
+        with mock.patch.object(requests.Session, 'get', side_effect=lambda url, **kwargs: responses[url]), \
+                mock.patch.object(PageArchive, 'flush', record_flush):
+            refresh_products(list(responses), max_workers=1, rate_per_host=0)
+
+        self.assertEqual(list(PageSnapshot.objects.values_list('product__product_url', flat=True)),
+                         [PRODUCT_URL.format('ok')])
+        self.assertEqual((archives[-1]._pages, archives[-1].skipped), ([], 1))
+
+
+class MaintenanceCommandTests(CatalogTestCase):
+    def call(self, *args, **options):
+        out = StringIO()
+        call_command(*args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_backfill_is_idempotent(self):
+        products = create_products(5, observations=0)
+        Product.objects.filter(pk=products[4].pk).update(price=None)
+
+        self.assertEqual(backfill_price_history(batch_size=2).count, 4)
+        self.assertEqual(backfill_price_history(batch_size=2).count, 0)
+        self.assertEqual(
+            set(PriceHistory.objects.values_list('product_id', 'price')),
+            {(product.pk, product.price) for product in products[:4]},
+        )
+        self.assertEqual(PriceSummary.objects.count(), 4)
+
+    def test_backfill_command_resumes_after_an_id(self):
+        products = create_products(5, observations=0)
+
+        output = self.call('backfill_price_history', batch_size=2, after_id=products[1].pk)
+        self.assertRegex(output, rf'2 observation\(s\) written, up to product id {products[3].pk} \(\d+ rows/s\)')
+        self.assertRegex(output, rf'3 observation\(s\) written, up to product id {products[4].pk} \(\d+ rows/s\)')
+        self.assertRegex(output, r'Backfilled 3 price observation\(s\) in \d+\.\ds \(\d+ rows/s\)\.')
+        self.assertEqual(
+            set(PriceHistory.objects.values_list('product_id', flat=True)), {product.pk for product in products[2:]},
+        )
+
+        self.assertIn('Backfilled 2 price observation(s)', self.call('backfill_price_history'))
+        self.assertIn('Backfilled 0 price observation(s)', self.call('backfill_price_history'))
+
+    def test_export_and_import_commands(self):
+        create_products(2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'history.csv')
+            output = self.call('export_history', path)
+            self.assertRegex(output, rf'Exported 6 price observation\(s\) to {re.escape(path)} in \d+\.\ds')
+            Product.objects.all().delete()
+
+            output = self.call('import_history', path, batch_size=4)
+            self.assertRegex(output, r'4 row\(s\) imported, 0 skipped \(\d+ rows/s\)')
+            self.assertIn('Imported 6 price observation(s), skipped 0 already recorded', output)
+            self.assertEqual(PriceHistory.objects.count(), 6)
+            self.assertIn('Imported 0 price observation(s), skipped 6 already recorded',
+                          self.call('import_history', path, format='csv'))
+
+            with self.assertRaisesMessage(CommandError, 'Cannot guess the format'):
+                self.call('export_history', os.path.join(directory, 'history.txt'))
+            with self.assertRaises(CommandError):
+                self.call('import_history', os.path.join(directory, 'missing.csv'))
+
+    def test_delete_products_in_batches(self):
+        deleted, kept = create_products(2), create_products(1, start=2)[0]
+        AlertRule.objects.create(product=deleted[0], kind=AlertRule.BELOW, threshold=50, email='a@example.com')
+        ensure_schedules()
+
+        throughput = delete_products_in_batches(Product.objects.exclude(pk=kept.pk), batch_size=1)
+
+        self.assertEqual(throughput.count, 2)
+        self.assertEqual(list(Product.objects.values_list('pk', flat=True)), [kept.pk])
+        for model in (PriceHistory, PriceSummary, RefreshSchedule, AlertRule):
+            self.assertFalse(model.objects.filter(product__in=deleted).exists())
+        self.assertTrue(PriceHistory.objects.filter(product=kept).exists())
+
+    def assert_round_trip(self, file_format):
+        create_products(3)
+        history = set(PriceHistory.objects.values_list('product__product_url', 'price', 'timestamp'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'history.{file_format}')
+            self.assertEqual(export_history(path, file_format).count, 9)
+            Product.objects.all().delete()
+
+            throughput, skipped = import_history(read_history(path, file_format), batch_size=4)
+            self.assertEqual((throughput.count, skipped), (9, 0))
+            self.assertEqual(
+                set(PriceHistory.objects.values_list('product__product_url', 'price', 'timestamp')), history,
+            )
+            self.assertEqual(
+                set(Product.objects.with_price_stats().values_list('price', 'current_price')),
+                {(102.0, 102.0), (103.0, 103.0), (104.0, 104.0)},
+            )
+
+            # Importing the same file again only skips rows.
+            throughput, skipped = import_history(read_history(path, file_format), batch_size=4)
+            self.assertEqual((throughput.count, skipped), (0, 9))
+
+    def test_export_and_import_history(self):
+        for file_format in ('csv', 'jsonl'):
+            with self.subTest(file_format):
+                self.assert_round_trip(file_format)
+                Product.objects.all().delete()
+
+    @skipUnless(transfer.pyarrow, 'pyarrow is not installed')
+    def test_export_and_import_parquet(self):
+        self.assert_round_trip('parquet')
+
+    def test_interrupted_import_is_resumed(self):
+        create_products(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'history.csv')
+            export_history(path, 'csv')
+            Product.objects.all().delete()
+
+            # The second batch fails: its products are rolled back with its observations.
+            calls = []
+            def fail_second_batch(observations, **kwargs):
+                calls.append(observations)
+                if len(calls) == 2:
+                    raise RuntimeError('interrupted')
+                return record_observations(observations, **kwargs)
+
+            with mock.patch('products.transfer.record_observations', side_effect=fail_second_batch):
+                with self.assertRaises(RuntimeError):
+                    import_history(read_history(path, 'csv'), batch_size=4)
+            self.assertFalse(Product.objects.filter(summary__isnull=True).exists())
+
+            throughput, skipped = import_history(read_history(path, 'csv'), batch_size=4)
+            self.assertEqual((throughput.count, skipped), (5, 4))
+            self.assertEqual(
+                set(Product.objects.with_price_stats().values_list('price', 'current_price')),
+                {(102.0, 102.0), (103.0, 103.0), (104.0, 104.0)},
+            )
+
+
+class RefreshScheduleTests(CatalogTestCase):
+    def test_next_interval(self):
+        day = 24 * 3600
+        # Four changes in ten days: checked about every one and a quarter days.
+        self.assertEqual(next_interval(4, 10 * day, day, 3600, 7 * day), 10 * day / 8)
+        self.assertEqual(next_interval(0, 10 * day, day, 3600, 7 * day), 2 * day)
+        self.assertEqual(next_interval(0, 10 * day, 5 * day, 3600, 7 * day), 7 * day)
+        self.assertEqual(next_interval(100, day, day, 3600, 7 * day), 3600)
+
+    @override_settings(REFRESH_LOOKBACK_DAYS=4)
+    def test_changes_of_write_on_change_history(self):
+        day = 24 * 3600
+        now = timezone.now()
+        product = Product.objects.create(name='Phone', product_url=PRODUCT_URL.format(1))
+        # Only changes are recorded: the price changed once in the lookback window.
+        record_observations(
+            [(product, 10, now - timedelta(days=10)), (product, 12, now - timedelta(days=2))], only_changes=True,
+        )
+        since = now - timedelta(days=4)
+        self.assertEqual(change_stats([product.pk], since), {product.pk: (1, since)})
+
+        schedule = RefreshSchedule.objects.create(product=product, interval=3 * day)
+        reschedule([schedule], jitter=0)
+        # One change in four days: checked every two days instead of backing off.
+        self.assertEqual(RefreshSchedule.objects.get().interval, 2 * day)
+
+    @mock.patch('products.refresh.get_link_data', return_value=None)
+    def test_only_due_products_are_fetched(self, get_link_data):
+        volatile = create_products(1, observations=5)[0]
+        stable = Product.objects.create(name='Stable', product_url=PRODUCT_URL.format('stable'))
+        PriceHistory.objects.bulk_create(
+            PriceHistory(product=stable, price=10, timestamp=timezone.now() - timedelta(days=days))
+            for days in range(10)
+        )
+
+        result, still_due = run_due_refreshes(requests_per_minute=0, jitter=0)
+        self.assertEqual((result.total, still_due), (2, 0))
+
+        intervals = dict(RefreshSchedule.objects.values_list('product_id', 'interval'))
+        self.assertEqual(intervals[volatile.pk], 3600)
+        self.assertEqual(intervals[stable.pk], 2 * 3600)
+
+        get_link_data.reset_mock()
+        result, _ = run_due_refreshes(requests_per_minute=0, jitter=0)
+        self.assertEqual(result.total, 0)
+        get_link_data.assert_not_called()
+
+    @override_settings(REFRESH_CLAIM_BATCH_SIZE=3, REFRESH_LEASE_SECONDS=10)
+    @mock.patch('products.refresh.HostRateLimiter.wait')
+    @mock.patch('products.refresh.get_link_data', return_value=None)
+    def test_due_pages_are_claimed_in_batches(self, get_link_data, wait):
+        create_products(7)
+
+        with mock.patch('products.scheduling.claim_due_schedules', wraps=claim_due_schedules) as claim:
+            result, still_due = run_due_refreshes(limit=5, requests_per_minute=6, jitter=0)
+        self.assertEqual((result.total, still_due), (5, 2))
+        self.assertEqual(get_link_data.call_count, 5)
+        # Each batch is leased for twice the 30 seconds its three pages take at 6 requests per minute.
+        self.assertEqual([call.args[1:] for call in claim.call_args_list], [(3, 60), (2, 60)])
+        self.assertFalse(RefreshSchedule.objects.exclude(leased_by='').exists())
+
+    def test_leases_split_due_pages(self):
+        create_products(5)
+        ensure_schedules()
+
+        first = claim_due_schedules('a', 3, lease_seconds=60)
+        second = claim_due_schedules('b', 3, lease_seconds=60)
+        self.assertEqual((len(first), len(second)), (3, 2))
+        self.assertFalse({s.pk for s in first} & {s.pk for s in second})
+        self.assertEqual(claim_due_schedules('c', 3, lease_seconds=60), [])
+
+        # Worker a died: its pages can be claimed once the lease expired.
+        later = timezone.now() + timedelta(seconds=61)
+        reclaimed = claim_due_schedules('c', 5, lease_seconds=60, now=later)
+        self.assertEqual({s.pk for s in reclaimed}, {s.pk for s in first} | {s.pk for s in second})
+
+    @mock.patch('products.refresh.get_link_data', return_value=None)
+    def test_refresh_worker_fetches_every_due_page_once(self, get_link_data):
+        create_products(7)
+        ensure_schedules()
+
+        result = run_refresh_worker('worker', batch_size=3, rate_per_host=0)
+        self.assertEqual(result.total, 7)
+        self.assertEqual(get_link_data.call_count, 7)
+        # The three batches are one run.
+        self.assertEqual(list(ScrapeRun.objects.values_list('pages', flat=True)), [7])
+        self.assertEqual(result.run.unchanged, 7)
+        self.assertFalse(RefreshSchedule.objects.exclude(leased_by='').exists())
+        self.assertEqual(run_refresh_worker('worker', batch_size=3, rate_per_host=0).total, 0)
+
+    @mock.patch('products.management.commands.run_refresh_workers.POLL_SECONDS', 0.1)
+    @mock.patch('products.management.commands.run_refresh_workers._worker', side_effect=lambda *args: os._exit(9))
+    def test_dead_refresh_worker_is_reported(self, worker):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '2 worker(s) failed.'):
+            call_command('run_refresh_workers', workers=2, stdout=out)
+        self.assertEqual(out.getvalue().count('failed: exited with code 9'), 2)
+
+
+class PriceSummaryTests(CatalogTestCase):
+    def summary_fields(self, product_id):
+        return PriceSummary.objects.filter(product_id=product_id).values(
+            'current_price', 'min_price', 'max_price', 'first_seen', 'last_seen',
+            'last_change_at', 'observation_count',
+        ).get()
+
+    def test_incremental_update_matches_rebuild(self):
+        product = Product.objects.create(name='Product', product_url=PRODUCT_URL.format(1))
+        start = timezone.now()
+        # The third observation arrives late and must not become the current price.
+        for minutes, price in [(0, 10), (10, 8), (5, 12), (20, 8), (30, '9.5')]:
+            record_observations([(product.pk, price, start + timedelta(minutes=minutes))])
+
+        incremental = self.summary_fields(product.pk)
+        self.assertEqual(incremental, {
+            'current_price': 9.5,
+            'min_price': 8.0,
+            'max_price': 12.0,
+            'first_seen': start,
+            'last_seen': start + timedelta(minutes=30),
+            'last_change_at': start + timedelta(minutes=30),
+            'observation_count': 5,
+        })
+
+        rebuild_summaries()
+        self.assertEqual(self.summary_fields(product.pk), incremental)
+
+    def test_batch_records_only_changes(self):
+        tracked, new = create_products(2, observations=1)
+        PriceHistory.objects.filter(product=new).delete()
+        PriceSummary.objects.filter(product=new).delete()
+        start = timezone.now()
+        batch = [
+            (tracked, tracked.price, start),
+            (tracked.pk, 12, start + timedelta(minutes=2)),
+            (tracked.pk, 12, start + timedelta(minutes=3)),
+            (new, '5', start),
+            (new, 6, start + timedelta(minutes=1)),
+        ]
+
+        with self.assertNumQueries(7):
+            written = record_observations(batch, only_changes=True)
+
+        self.assertEqual([(row.product_id, row.price) for row in written], [(new.pk, 5.0), (new.pk, 6.0), (tracked.pk, 12.0)])
+        incremental = [self.summary_fields(product.pk) for product in (tracked, new)]
+        rebuild_summaries()
+        self.assertEqual([self.summary_fields(product.pk) for product in (tracked, new)], incremental)
+
+    def test_history_on_save(self):
+        product = Product.objects.create(name='Product', price=10, product_url=PRODUCT_URL.format(1))
+        self.assertFalse(PriceHistory.objects.exists())
+
+        with override_settings(PRICE_HISTORY_ON_SAVE=True):
+            product.price = 12
+            product.save()
+            self.assertEqual(list(PriceHistory.objects.values_list('product_id', 'price')), [(product.pk, 12.0)])
+            product.save()
+            self.assertEqual(PriceHistory.objects.count(), 1)
+        self.assertEqual(PriceSummary.objects.get(product=product).current_price, 12.0)
+
+
+class SearchTests(CatalogTestCase):
+    def search(self, query):
+        # The writes below bypass the catalog version on purpose.
+        cache.clear()
+        response = self.client.get(reverse('search_results'), {'q': query})
+        return [product.name for product in response.context['products']]
+
+    def test_ranking_and_dedupe(self):
+        Product.objects.bulk_create([
+            Product(name='Sony headphones', description='Wireless', product_url=PRODUCT_URL.format(1)),
+            Product(name='Sony headphones', description='Wireless', product_url=PRODUCT_URL.format(2)),
+            Product(name='Cable', description='Works with Sony headphones', product_url=PRODUCT_URL.format(3)),
+            Product(name='Samsung phone', description='', product_url=PRODUCT_URL.format(4)),
+        ])
+
+        self.assertEqual(self.search('sony head'), ['Sony headphones', 'Cable'])
+        self.assertEqual(self.search('"sony*('), ['Sony headphones', 'Cable'])
+        self.assertEqual(self.search(''), ['Cable', 'Samsung phone', 'Sony headphones'])
+
+    def test_index_follows_writes(self):
+        product = Product.objects.create(name='Old name', product_url=PRODUCT_URL.format(1))
+        Product.objects.filter(pk=product.pk).update(name='New name')
+        self.assertEqual(self.search('new'), ['New name'])
+        self.assertEqual(self.search('old'), [])
+
+        product.delete()
+        self.assertEqual(self.search('new'), [])
+
+
+class PriceHistorySeriesTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Product', product_url=PRODUCT_URL.format(1))
+        cls.start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=10)
+        PriceHistory.objects.bulk_create(
+            PriceHistory(product=cls.product, price=100 + hour % 24, timestamp=cls.start + timedelta(hours=hour))
+            for hour in range(24 * 10)
+        )
+
+    def get_series(self, **params):
+        response = self.client.get(reverse('price_history_series', args=[self.product.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_downsampling_keeps_end_points(self):
+        series = self.get_series(points=50)
+        self.assertEqual(len(series['prices']), 50)
+        self.assertEqual(series['timestamps'][0], self.start.isoformat())
+        self.assertIn(123.0, series['prices'])
+
+    def test_daily_buckets(self):
+        series = self.get_series(bucket='day')
+        self.assertEqual(len(series['prices']), 10)
+        self.assertEqual((series['min'][0], series['max'][0], series['prices'][0]), (100.0, 123.0, 123.0))
+
+    def test_since_cursor(self):
+        series = self.get_series(since=(self.start + timedelta(hours=229)).isoformat())
+        self.assertEqual(len(series['prices']), 10)
+        self.assertEqual(self.get_series(since=series['cursor'])['prices'], [])
+
+    def test_invalid_since(self):
+        url = reverse('price_history_series', args=[self.product.pk])
+        for since in ('yesterday', '2024-13-01T00:00'):
+            response = self.client.get(url, {'since': since})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'since must be an ISO 8601 datetime'})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is checked for SQLite')
+class QueryPlanTests(CatalogTestCase):
+    """The hot lookups must be served by indexes, never by full scans or sorts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_products(20)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        # A "SCAN <table>" line without "USING ... INDEX" is a full table scan.
+        self.assertNotRegex(plan, r'(?m)\bSCAN \S+\s*$')
+        self.assertNotIn('TEMP B-TREE', plan)
+        return plan
+
+    def test_lookup_by_url(self):
+        queryset = Product.objects.filter(product_url=self.products[0].product_url)
+        plan = self.assertUsesIndex(queryset)
+        self.assertIn('(product_url=?)', plan)
+
+    def test_product_list(self):
+        queryset = Product.objects.with_price_stats().order_by('name', 'id')[:9]
+        plan = self.assertUsesIndex(queryset)
+        self.assertIn('product_name_idx', plan)
+
+    def test_api_product_page(self):
+        product = self.products[5]
+        queryset = (
+            Product.objects.with_price_stats().order_by('-timestamp', '-id')
+            .filter(timestamp__lte=product.timestamp).exclude(timestamp=product.timestamp, id__gte=product.pk)[:10]
+        )
+        plan = self.assertUsesIndex(queryset)
+        self.assertIn('product_timestamp_id_idx', plan)
+
+    def test_product_history(self):
+        queryset = self.products[0].price_history.order_by('timestamp')
+        plan = self.assertUsesIndex(queryset)
+        self.assertIn('pricehistory_product_ts_idx', plan)
+
+
+class FoldDuplicateProductsMigrationTests(TransactionTestCase):
+    """Runs 0003_fold_duplicate_products on rows written before it, with and without the old history script."""
+    before = [('products', '0002_pricehistory_pagevalidator')]
+    after = [('products', '0003_fold_duplicate_products')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        apps = self.executor.loader.project_state(self.before).apps
+        self.Product = apps.get_model('products', 'Product')
+        self.PriceHistory = apps.get_model('products', 'PriceHistory')
+        self.addCleanup(call_command, 'migrate', verbosity=0)
+
+    def create_rows(self, run_history_script):
+        start = timezone.now() - timedelta(days=3)
+        for days, price in enumerate([10.0, None, 12.0]):
+            product = self.Product.objects.create(product_url=PRODUCT_URL.format(1), name='Phone', price=price)
+            self.Product.objects.filter(pk=product.pk).update(timestamp=start + timedelta(days=days))
+            if run_history_script and price is not None:
+                # PriceHistory.timestamp was auto_now_add, as the script wrote it.
+                history = self.PriceHistory.objects.create(product=product, price=price)
+                self.PriceHistory.objects.filter(pk=history.pk).update(timestamp=timezone.now())
+        return start
+
+    def migrate(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.after)
+        apps = self.executor.loader.project_state(self.after).apps
+        product = apps.get_model('products', 'Product').objects.get()
+        prices = list(
+            apps.get_model('products', 'PriceHistory').objects.order_by('timestamp').values_list('price', flat=True)
+        )
+        return product, prices
+
+    def test_without_history_script(self):
+        start = self.create_rows(run_history_script=False)
+        product, prices = self.migrate()
+        self.assertEqual((product.price, product.timestamp), (12.0, start))
+        self.assertEqual(prices, [10.0, 12.0])
+
+    def test_after_history_script(self):
+        self.create_rows(run_history_script=True)
+        product, prices = self.migrate()
+        self.assertEqual(product.price, 12.0)
+        self.assertEqual(prices, [10.0, 12.0])
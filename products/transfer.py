@@ -0,0 +1,216 @@
+"""
+Export and import of price history as flat files, one row per observation.
+
+Every row carries the product it belongs to, identified by its URL, so a file
+exported from one instance can be imported into another one.
+"""
+import csv
+import json
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from products.maintenance import Throughput, chunked
+from products.models import PriceHistory, PriceSummary, Product
+from products.observations import record_observations
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+PRODUCT_COLUMNS = ('product_url', 'name', 'photo_url', 'supplier', 'supplier_url')
+COLUMNS = PRODUCT_COLUMNS + ('price', 'timestamp')
+
+
+def guess_format(path):
+    """
+    :param path: file name
+    :return: the format matching the extension of the file, or None
+    """
+    extension = path.rsplit('.', 1)[-1].lower()
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl', 'parquet': 'parquet'}.get(extension)
+
+
+def _check_format(file_format):
+    if file_format not in FORMATS:
+        raise ValueError(f'unknown format {file_format!r}, expected one of {", ".join(FORMATS)}')
+    if file_format == 'parquet' and pyarrow is None:
+        raise ValueError('the parquet format requires pyarrow')
+
+
+def history_rows(batch_size=5000):
+    """
+    Streams all price observations joined with their product without loading
+    more than one chunk into memory. Rows are ordered along the (product,
+    timestamp) index, which keeps the observations of a product together, so
+    an import updates the price summary of every product only once or twice.
+    :return: iterator of tuples in the order of COLUMNS
+    """
+    return (
+        PriceHistory.objects
+        .order_by('product_id', 'timestamp', 'id')
+        .values_list(*(f'product__{column}' for column in PRODUCT_COLUMNS), 'price', 'timestamp')
+        .iterator(chunk_size=batch_size)
+    )
+
+
+def _parquet_schema():
+    fields = [(column, pyarrow.string()) for column in PRODUCT_COLUMNS]
+    fields += [('price', pyarrow.float64()), ('timestamp', pyarrow.timestamp('us', tz='UTC'))]
+    return pyarrow.schema(fields)
+
+
+def export_history(path, file_format, batch_size=5000, report=None):
+    """
+    Writes the price history to a file.
+    :param path: output file name
+    :param file_format: csv, jsonl or parquet
+    :param batch_size: rows read from the database per query
+    :param report: optional callable(throughput) invoked after every batch
+    :return: Throughput with the number of exported rows
+    """
+    _check_format(file_format)
+    throughput = Throughput()
+    batches = chunked(history_rows(batch_size), batch_size)
+
+    if file_format == 'parquet':
+        schema = _parquet_schema()
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for batch in batches:
+                columns = [list(column) for column in zip(*batch)]
+                writer.write_batch(pyarrow.record_batch(columns, schema=schema))
+                throughput.add(len(batch))
+                if report is not None:
+                    report(throughput)
+        return throughput
+
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        if file_format == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(COLUMNS)
+            write_rows = writer.writerows
+        else:
+            def write_rows(rows):
+                output.writelines(json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in rows)
+
+        for batch in batches:
+            write_rows([row[:-1] + (row[-1].isoformat(),) for row in batch])
+            throughput.add(len(batch))
+            if report is not None:
+                report(throughput)
+    return throughput
+
+
+def read_history(path, file_format, batch_size=5000):
+    """
+    Reads observations from a file written by export_history.
+    :return: iterator of dicts keyed by COLUMNS
+    """
+    _check_format(file_format)
+
+    if file_format == 'parquet':
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size, columns=list(COLUMNS)):
+            yield from batch.to_pylist()
+        return
+
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _parse_row(row, line):
+    try:
+        timestamp = row['timestamp']
+        if isinstance(timestamp, str):
+            timestamp = parse_datetime(timestamp)
+        if timestamp is None:
+            raise ValueError('invalid timestamp')
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+        return row['product_url'], float(row['price']), timestamp
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'row {line}: {e}') from e
+
+
+def import_history(rows, batch_size=5000, report=None):
+    """
+    Loads observations in batches, each in its own transaction. Products that
+    do not exist yet are created from the first row of their URL. Rows whose
+    (url, timestamp) is already recorded are skipped, so an interrupted import
+    can simply be run again.
+    :param rows: iterable of dicts as returned by read_history
+    :param batch_size: rows written per transaction
+    :param report: optional callable(throughput, skipped) invoked after every batch
+    :return: tuple (Throughput with the number of imported rows, number of skipped rows)
+    """
+    throughput = Throughput()
+    skipped = 0
+    line = 0
+
+    for batch in chunked(rows, batch_size):
+        observations = {}
+        product_rows = {}
+        for row in batch:
+            line += 1
+            url, price, timestamp = _parse_row(row, line)
+            observations.setdefault((url, timestamp), price)
+            product_rows.setdefault(url, row)
+
+        with transaction.atomic():
+            product_ids = dict(
+                Product.objects.filter(product_url__in=product_rows).values_list('product_url', 'id')
+            )
+            missing = [url for url in product_rows if url not in product_ids]
+            if missing:
+                Product.objects.bulk_create(
+                    [Product(**{column: product_rows[url].get(column) or None for column in PRODUCT_COLUMNS})
+                     for url in missing],
+                    batch_size=batch_size,
+                    ignore_conflicts=True,
+                )
+                product_ids.update(Product.objects.filter(product_url__in=missing).values_list('product_url', 'id'))
+
+            timestamps = [timestamp for _, timestamp in observations]
+            recorded = set(
+                PriceHistory.objects
+                .filter(product_id__in=set(product_ids.values()), timestamp__range=(min(timestamps), max(timestamps)))
+                .values_list('product_id', 'timestamp')
+            )
+            new = [
+                (product_ids[url], price, timestamp)
+                for (url, timestamp), price in observations.items()
+                if (product_ids[url], timestamp) not in recorded
+            ]
+            skipped += len(batch) - len(new)
+
+            if new:
+                # Products without a price, such as the ones created by the
+                # import, and products whose price is their latest observation
+                # show the latest price after the batch, also in a rerun.
+                following = list(
+                    Product.objects
+                    .filter(id__in={product_id for product_id, _, _ in new})
+                    .filter(Q(price__isnull=True) | Q(price=F('summary__current_price')))
+                    .values_list('id', flat=True)
+                )
+                record_observations(new, batch_size=batch_size)
+                if following:
+                    Product.objects.filter(id__in=following).update(price=Subquery(
+                        PriceSummary.objects.filter(product_id=OuterRef('pk')).values('current_price')
+                    ))
+        throughput.add(len(new))
+        if report is not None:
+            report(throughput, skipped)
+
+    return throughput, skipped
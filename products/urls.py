@@ -1,12 +1,21 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.ProductListView.as_view(), name='product_list'),
-    path('product/<int:pk>/', views.ProductDetailView.as_view(), name='product_detail'),
+    path('product/<int:pk>/', views.product_detail, name='product_detail'),
+    path('product/<int:pk>/history/', views.price_history_series, name='price_history_series'),
     path('add/', views.add_product, name='add_product'),
     path('update_product/', views.update_product, name='update_product'),
     path('delete/<int:pk>/', views.delete_product, name='delete_product'),
     path('search/', views.search_results, name='search_results'),
+    path('jobs/<int:pk>/', views.job_detail, name='job_detail'),
+    path('jobs/<int:pk>/status/', views.job_status, name='job_status'),
+    path('api/products/', api.product_list, name='api_product_list'),
+    path('api/products/<int:pk>/history/', api.product_history, name='api_product_history'),
+    path('api/products/bulk-add/', api.bulk_add, name='api_bulk_add'),
+    path('api/products/bulk-delete/', api.bulk_delete, name='api_bulk_delete'),
+    path('api/products/<int:pk>/alerts/', api.create_alert, name='api_create_alert'),
+    path('metrics/', views.scrape_metrics, name='scrape_metrics'),
 
 ]
\ No newline at end of file
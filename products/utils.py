@@ -1,146 +1,123 @@
-from bs4 import BeautifulSoup
-import requests
-from django.db import transaction
-from products.models import Product
-from fake_useragent import UserAgent
+import hashlib
 
+from django.db import transaction
 
+from products.archive import PageArchive, archive_enabled
+from products.caching import bump_catalog_version
+from products.extractors import format_price, get_extractor
+from products.fetcher import get_fetcher, random_user_agent
+from products.metrics import FIELDS, current_page, timed
+from products.models import PageValidator, Product
+from products.observations import record_observations
 
 
 def get_random_user_agent():
     """
-    Returns a random user agent string using fake_useragent.
+    Returns a random user agent string from the preloaded rotation list.
     :return: random user agent string
     """
-    ua = UserAgent()
-    return ua.random
+    return random_user_agent()
 
-print(get_random_user_agent())
 
-
-def format_price(price_text):
-    """
-    Formats the price string to a float.
-    :param price_text: price string
-    :return: formatted price as float
-    """
-
-    price_text = price_text.replace('€', '').replace('-', '').replace('\xa0', '').strip()
-    price_text = price_text.replace('.', '')
-    price_text = price_text.replace(',', '.')
-
-    if price_text.count('.') == 1 and price_text.endswith('.'):
-        price_text = price_text[:-1]
-
-    return price_text
-
-
-def get_link_data(url):
+def get_link_data(url, validator=None, archive=None):
     """
     Gets product data from a link.
     param url: product URL
-    return: tuple with product data (name, price, photo, base URL, supplier, supplier URL, description)
+    param validator: optional PageValidator of the URL; when given, the request is
+        conditional and the validator is updated in place from the response
+    param archive: optional PageArchive that receives the page before it is parsed
+    return: tuple with product data (name, price, photo, base URL, supplier, supplier URL, description),
+        or None when the validator shows that the page has not changed since the last fetch
     """
     if not url:
         return "", None, "", "", "", "", ""
 
-    headers = {
-        
-        "User-Agent": get_random_user_agent(),
+    headers = {}
+    if validator is not None:
+        if validator.etag:
+            headers["If-None-Match"] = validator.etag
+        if validator.last_modified:
+            headers["If-Modified-Since"] = validator.last_modified
 
-        "Accept-Language": "en-GB,en;q=0.9",
-        "Referer": "https://www.google.com/"
-    }
-    
-    session = requests.Session()
-    response = session.get(url, headers=headers, timeout=15)
+    response = get_fetcher().get(url, headers=headers)
+    if response.status_code == 304 and validator is not None:
+        return None
     if response.status_code != 200:
         return "", None, "", "", "", "", ""
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    if not soup:
-        return "", None, "", "", "", "", ""
-
-    base_url = url
-
-    img_tag = soup.select_one("div.gallery-trigger img")
-    photo_url = img_tag["src"] if img_tag and img_tag.has_attr("src") else ""
-
-    name_block = soup.find("h1", class_="line-clamp")
-    name = name_block.get_text(strip=True) if name_block else ""
+    if validator is not None:
+        body_hash = hashlib.sha256(response.content).hexdigest()
+        unchanged = body_hash == validator.body_hash
 
-    price = None
-    price_tag = soup.find("span", class_="lowest-price")
-    if price_tag:
-        price = format_price(price_tag.get_text(strip=True))
+        validator.etag = response.headers.get("ETag", "")
+        validator.last_modified = response.headers.get("Last-Modified", "")
+        validator.body_hash = body_hash
+        if unchanged:
+            return None
 
-    supplier_block = soup.find("span", class_="ellipsis")
-    supplier = supplier_block.get_text(strip=True) if supplier_block else ""
+    text = response.text
+    if archive is not None:
+        archive.add(url, text)
 
-    supplier_block_url = soup.find("a", class_="price")
-    supplier_url = supplier_block_url["href"] if supplier_block_url and supplier_block_url.has_attr("href") else ""
+    page = current_page()
+    with timed(page, 'parse_seconds'):
+        fields = get_extractor().extract(text)
+    if page is not None:
+        page.misses = tuple(field for field, value in zip(FIELDS, fields) if value in ("", None))
 
-    description = ""
-    all_specs = soup.find_all("div", class_="spec-content spec-line")
-    for spec in all_specs:
-        description_block = spec.find("a", class_="line-clamp")
-        if description_block:
-            description = description_block.get_text(strip=True)
-            break  
+    name, price, photo_url, supplier, supplier_url, description = fields
 
-    return name, price, photo_url, base_url, supplier, supplier_url, description
+    return name, price, photo_url, url, supplier, supplier_url, description
 
 
 def save_product_data(url):
-    """Saves the product data to the database."""
-    
-    data = get_link_data(url)
-
-    product = Product.objects.create(
-        name=data[0],
-        price=data[1],
-        photo_url=data[2],
-        product_url=url,
-        supplier=data[4],
-        supplier_url=data[5],
-        description=data[6],
-    )
-
-    created = True
+    """
+    Saves the product data to the database and records the scraped price if it changed.
+    :param url: product URL
+    :return: tuple (product, created)
+    :raises ValueError: when the page could not be fetched or holds neither a name nor a price
+    """
+    archive = PageArchive() if archive_enabled() else None
+    name, price, photo_url, _, supplier, supplier_url, description = get_link_data(url, archive=archive)
+    if not name and price is None:
+        raise ValueError("no product data found on the page")
+
+    with transaction.atomic():
+        product, created = Product.objects.get_or_create(
+            product_url=url,
+            defaults={
+                'name': name,
+                'price': price,
+                'photo_url': photo_url,
+                'supplier': supplier,
+                'supplier_url': supplier_url,
+                'description': description,
+            },
+        )
+
+        if price is not None:
+            record_observations([(product, price, None)], only_changes=True)
+        if archive is not None:
+            archive.flush({url: product.pk}.get)
+        if created:
+            bump_catalog_version()
 
     return product, created
 
 
-
 def update_all_product_data():
     """
     Updates all product data in the database.
-    :return: None
+    :return: RefreshResult with the number of updated, unchanged and failed URLs
     """
+    from products.refresh import refresh_products
 
-
-    all_urls = Product.objects.values_list('product_url', flat=True).distinct()
-
-    for url in all_urls:
-        name, price, photo_url, _, supplier, supplier_url, description = get_link_data(url)
-
-        with transaction.atomic():
-            Product.objects.create(
-                product_url=url,
-                name=name,
-                price=price,
-                photo_url=photo_url,
-                supplier=supplier,
-                supplier_url=supplier_url,
-                description=description,
-            )
-
-            print(f"Updated product from URL: {url}")
+    return refresh_products()
 
 
 def delete_products_by_url(url):
     """
-    Deletes all products with the given URL from the database.
+    Deletes the product with the given URL and its price history from the database.
     :param url: product URL
     :return: None
     """
@@ -148,8 +125,11 @@ def delete_products_by_url(url):
     products_to_delete = Product.objects.filter(product_url=url)
     
     if products_to_delete.exists():
-        products_to_delete.delete()
-        print(f"All product from URL: {url} deleted.")
+        with transaction.atomic():
+            products_to_delete.delete()
+            PageValidator.objects.filter(product_url=url).delete()
+            bump_catalog_version()
+        print(f"Product from URL: {url} deleted.")
     else:
         print(f"Product from URL: {url} not found.")
 
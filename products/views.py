@@ -1,16 +1,28 @@
 import json
 
+from django.conf import settings
 from django.contrib import messages
+from django.core.paginator import Paginator
 from django.db import transaction
-from django.shortcuts import get_object_or_404, redirect, render
-from django.views.generic import DetailView, ListView
-from django.db.models import Q, Max, Min
-
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_GET
+from django.views.generic import ListView
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from products.caching import bump_catalog_version, catalog_page, get_catalog_version
 from products.forms import ProductUrlForm
-from products.utils import get_link_data, save_product_data
-from .models import Product, PriceHistory
+from products.jobs import ADD_PRODUCT, REFRESH, aenqueue_job
+from products.metrics import render_prometheus
+from products.search import search_products
+from products.series import BUCKETS, aload_series
+from .models import Job, PageValidator, Product
 
 
+@method_decorator(catalog_page, name='dispatch')
 class ProductListView(ListView):
     model = Product
     template_name = 'products/product_list.html'
@@ -18,60 +30,74 @@ class ProductListView(ListView):
     paginate_by = 9
 
     def get_queryset(self):
-        all_products = Product.objects.all().order_by('-timestamp')
-
-        unique_products = {}
-
-        for product in all_products:
-            key = (product.name, product.product_url)
-
-            if key not in unique_products:
-                product_prices = Product.objects.filter(
-                    name=product.name,
-                    product_url=product.product_url
-                )
-
-                product.min_price = product_prices.aggregate(Min('price'))['price__min']
-                product.max_price = product_prices.aggregate(Max('price'))['price__max']
-                product.first_added = product_prices.aggregate(Min('timestamp'))['timestamp__min']
-                product.last_added = product_prices.aggregate(Max('timestamp'))['timestamp__max']
+        return Product.objects.defer('description').with_price_stats().order_by('name', 'id')
 
-                unique_products[key] = product
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Product cards are cached as template fragments per catalog version.
+        context['catalog_version'] = get_catalog_version()[0]
+        context['cache_timeout'] = getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+        return context
 
-        return sorted(unique_products.values(), key=lambda p: p.name)
 
+@catalog_page
+async def product_detail(request, pk):
+    """
+    View showing a product with its price chart
+    """
+    product = await aget_object_or_404(Product, pk=pk)
+    series = await aload_series(product, points=getattr(settings, 'PRICE_CHART_POINTS', 200))
 
-class ProductDetailView(DetailView):
-    model = Product
-    template_name = 'products/product_detail.html'
-    context_object_name = 'product'
+    labels = series['labels']
+    prices = series['prices']
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        product = self.get_object()
-        price_history = Product.objects.filter(product_url=product.product_url) 
+    if not prices:
+        labels = [product.timestamp.strftime('%d.%m.%Y')]
+        prices = [float(product.price)] if product.price is not None else [0.0]
 
-        labels = []
-        prices = []
+    return render(request, 'products/product_detail.html', {
+        'product': product,
+        'price_history_labels': json.dumps(labels),
+        'price_history_data': json.dumps(prices),
+    })
 
-        if not price_history:
-            labels = [product.timestamp.strftime('%d.%m.%Y')]
-            prices = [float(product.price)] if product.price is not None else [0.0]
-        else:
-            for history in (list(price_history)):
-                labels.append(history.timestamp.strftime('%d.%m.%Y'))
-                if history.price is not None:
-                    prices.append(float(history.price))
-                else:
-                    prices.append(0.0)
 
-        context['price_history_labels'] = json.dumps(labels)
-        context['price_history_data'] = json.dumps(prices)
+@catalog_page
+async def price_history_series(request, pk):
+    """
+    JSON price series of a product for the chart.
 
-        return context
+    Query parameters: `bucket` ('day' or 'week') aggregates min/max/last per bucket,
+    `points` downsamples to at most that many points and `since` (ISO datetime)
+    only returns observations after the cursor of a previous response.
+    """
+    product = await aget_object_or_404(Product.objects.only('id'), pk=pk)
 
+    bucket = request.GET.get('bucket') or None
+    if bucket is not None and bucket not in BUCKETS:
+        return JsonResponse({'error': f"bucket must be one of: {', '.join(BUCKETS)}"}, status=400)
 
-def add_product(request):
+    try:
+        points = int(request.GET.get('points', 0))
+    except ValueError:
+        return JsonResponse({'error': 'points must be an integer'}, status=400)
+
+    since = request.GET.get('since')
+    if since:
+        try:
+            since = parse_datetime(since)
+        except ValueError:
+            # Well-formed but out of range, such as month 13.
+            since = None
+        if since is None:
+            return JsonResponse({'error': 'since must be an ISO 8601 datetime'}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    return JsonResponse(await aload_series(product, since=since or None, bucket=bucket, points=points))
+
+
+async def add_product(request):
     """
     View to add a new product by URL
     """
@@ -80,7 +106,7 @@ def add_product(request):
         if form.is_valid():
             url = form.cleaned_data['url']
 
-            existing_product = Product.objects.filter(product_url=url).first()
+            existing_product = await Product.objects.filter(product_url=url).afirst()
 
             if existing_product:
                 form.add_error('url', 'A product with this URL already exists in the database.')
@@ -90,15 +116,10 @@ def add_product(request):
                     'existing_product': existing_product
                 })
 
-            try:
-                product, created = save_product_data(url)
-                if created:
-                    messages.success(request, 'Product added successfully!')
-                    return redirect('product_detail', pk=product.pk)
-                else:
-                    return redirect('product_list')
-            except Exception as e:
-                form.add_error(None, str(e))
+            # The page is fetched by the job worker, not in the request.
+            job, _ = await aenqueue_job(ADD_PRODUCT, {'url': url}, dedupe_key=f'{ADD_PRODUCT}:{url}')
+            messages.info(request, 'The product is being added.')
+            return redirect('job_detail', pk=job.pk)
     else:
         form = ProductUrlForm()
 
@@ -107,114 +128,101 @@ def add_product(request):
 
 def delete_product(request, pk):
     """
-    View to delete a specific product and all other products with the same URL
+    View to delete a specific product together with its price history
     """
     product = get_object_or_404(Product, pk=pk)
 
     if request.method == 'POST':
         product_url = product.product_url
 
-        products_to_delete = Product.objects.filter(product_url=product_url)
+        history_count = product.price_history.count()
 
-        delete_count = products_to_delete.count()
-
-        products_to_delete.delete()
+        with transaction.atomic():
+            product.delete()
+            PageValidator.objects.filter(product_url=product_url).delete()
+            bump_catalog_version()
 
         from django.contrib import messages
-        messages.success(request, f'Deleted {delete_count} product(s) with URL: {product_url}')
+        messages.success(request, f'Deleted product with {history_count} price record(s) with URL: {product_url}')
 
         return redirect('product_list')
 
     return render(request, 'products/product_confirm_delete.html', {'product': product})
 
 
-def update_product(request):
+async def update_product(request):
     """
-    View to update all existing product data in the database
+    View to queue a refresh of all existing product data in the database.
+    While a refresh is queued or running, that job is reused.
     """
-    try:
-        initial_unique_urls = Product.objects.values_list('product_url', flat=True).distinct().count()
-
-        current_product_count = Product.objects.count()
-
-        all_urls = Product.objects.values_list('product_url', flat=True).distinct()
-        updated_products = 0
-
-        for url in all_urls:
-            name, price, photo_url, _, supplier, supplier_url, description = get_link_data(url)
-
-            with transaction.atomic():
-                Product.objects.create(
-                    product_url=url,
-                    name=name,
-                    price=price,
-                    photo_url=photo_url,
-                    supplier=supplier,
-                    supplier_url=supplier_url,
-                    description=description,
-                )
-                updated_products += 1
-
-        final_unique_urls = Product.objects.values_list('product_url', flat=True).distinct().count()
-        final_product_count = Product.objects.count()
-
-        message = (
-            f"Product Update Complete: "
-            f"{updated_products} new entries added. "
-            f"Unique URLs before: {initial_unique_urls}, after: {final_unique_urls}. "
-            f"Total products before: {current_product_count}, after: {final_product_count}."
-        )
+    if request.method != 'POST':
+        return render(request, 'products/update_confirm.html')
 
-        from django.contrib import messages
-        messages.success(request, message)
+    job, created = await aenqueue_job(REFRESH, dedupe_key=REFRESH)
+    if created:
+        messages.info(request, 'Product update queued.')
+    else:
+        messages.info(request, 'A product update is already in progress.')
+    return redirect('job_detail', pk=job.pk)
+
+
+def _job_state(job):
+    state = {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'result': job.result,
+        'error': job.error,
+        'finished': job.is_finished,
+        'redirect_url': None,
+    }
+    if job.status == Job.DONE:
+        if job.kind == ADD_PRODUCT:
+            state['redirect_url'] = reverse('product_detail', args=[job.result['product_id']])
+        else:
+            state['redirect_url'] = reverse('product_list')
+    return state
 
-        return redirect('product_list')
 
-    except Exception as e:
-        from django.contrib import messages
-        messages.error(request, f'An error occurred while updating products: {str(e)}')
+def job_detail(request, pk):
+    """
+    View showing the progress of a background job
+    """
+    job = get_object_or_404(Job, pk=pk)
+    return render(request, 'products/job_detail.html', {'job': job, 'state': _job_state(job)})
 
-        return redirect('product_list')
+
+async def job_status(request, pk):
+    """
+    JSON status of a background job, polled by the job page.
+    """
+    job = await aget_object_or_404(Job, pk=pk)
+    return JsonResponse(_job_state(job))
+
+
+@require_GET
+def scrape_metrics(request):
+    """
+    Scrape metrics in the Prometheus text format
+    """
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
+@catalog_page
 def search_results(request):
-    query = request.GET.get('q') 
-    
-    if query:
-        # 1. Получаем все товары, которые соответствуют поисковому запросу
-        # Отсортируем их по дате создания (или по ID) для детерминированного выбора дубликата
-        # Например, если вам нужна самая свежая запись, сортируйте по '-created_at'
-        # Если такого поля нет, можно сортировать по ID: .order_by('id')
-        products_raw = Product.objects.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        ).order_by('id') # Отсортируем по ID, чтобы выбор дубликата был предсказуемым (первая найденная)
-        
-        # 2. Удаление дубликатов по наименованию на уровне Python
-        seen_names = set()
-        unique_products = []
-        
-        for product in products_raw:
-            if product.name not in seen_names:
-                unique_products.append(product)
-                seen_names.add(product.name)
-        
-        products = unique_products 
-    else:
-        # Если запрос пустой, можно показать все уникальные товары или ничего
-        # Если вы хотите показать все уникальные товары, но только по одному экземпляру имени:
-        all_products_raw = Product.objects.all().order_by('id')
-        seen_names = set()
-        unique_products = []
-        for product in all_products_raw:
-            if product.name not in seen_names:
-                unique_products.append(product)
-                seen_names.add(product.name)
-        products = unique_products
-        # Или просто products = [] если не нужно ничего выводить при пустом запросе
-        
+    """
+    View to search products by name and description with the full-text index
+    """
+    query = request.GET.get('q')
+
+    paginator = Paginator(search_products(query), getattr(settings, 'SEARCH_RESULTS_PER_PAGE', 20))
+    page_obj = paginator.get_page(request.GET.get('page'))
 
     context = {
-        'products': products,
+        'products': page_obj.object_list,
+        'page_obj': page_obj,
         'query': query, 
     }
-    return render(request, 'products/search_results.html', context)
\ No newline at end of file
+    return render(request, 'products/search_results.html', context)
@@ -0,0 +1,52 @@
+document.addEventListener('DOMContentLoaded', function() {
+    var jobElement = document.getElementById('jobStatus');
+    if (!jobElement) return;
+
+    var statusUrl = jobElement.getAttribute('data-status-url');
+    var statusLabels = {queued: 'Queued', running: 'Running', done: 'Done', failed: 'Failed'};
+
+    function field(name) {
+        return jobElement.querySelector('[data-job-field="' + name + '"]');
+    }
+
+    function render(state) {
+        field('status').textContent = statusLabels[state.status] || state.status;
+        field('progress').textContent = state.progress;
+        field('total').textContent = state.total || '?';
+        field('bar').style.width = (state.total ? Math.round(100 * state.progress / state.total) : 0) + '%';
+
+        if (state.error) {
+            field('error').textContent = state.error;
+            field('error').classList.remove('d-none');
+        }
+        if (state.status === 'done' && state.kind === 'refresh') {
+            field('result').textContent = state.result.updated + ' products updated, ' +
+                state.result.unchanged + ' unchanged, ' + state.result.failed + ' failed.';
+            field('result').classList.remove('d-none');
+        }
+    }
+
+    function poll() {
+        fetch(statusUrl)
+            .then(function(response) { return response.json(); })
+            .then(function(state) {
+                render(state);
+                if (state.redirect_url && state.kind === 'add_product') {
+                    window.location.href = state.redirect_url;
+                } else if (!state.finished) {
+                    setTimeout(poll, 2000);
+                }
+            })
+            .catch(function(error) {
+                console.error("Error loading job status:", error);
+                setTimeout(poll, 5000);
+            });
+    }
+
+    var initialState = JSON.parse(document.getElementById('jobState').textContent);
+    if (initialState.redirect_url && initialState.kind === 'add_product') {
+        window.location.href = initialState.redirect_url;
+    } else if (!initialState.finished) {
+        setTimeout(poll, 1000);
+    }
+});
@@ -56,6 +56,23 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
         });
+
+        var seriesUrl = chartElement.getAttribute('data-series-url');
+        document.querySelectorAll('[data-series-params]').forEach(function(button) {
+            button.addEventListener('click', function() {
+                var params = button.getAttribute('data-series-params');
+                fetch(seriesUrl + '?' + params)
+                    .then(function(response) { return response.json(); })
+                    .then(function(series) {
+                        priceChart.data.labels = series.labels;
+                        priceChart.data.datasets[0].data = series.prices;
+                        priceChart.update();
+                    })
+                    .catch(function(error) {
+                        console.error("Error loading price history:", error);
+                    });
+            });
+        });
     } catch (error) {
         console.error("Error parsing JSON:", error);
     }
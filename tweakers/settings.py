@@ -1,4 +1,5 @@
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,14 +65,77 @@ WSGI_APPLICATION = 'tweakers.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite is the default. Set DATABASE_ENGINE=postgresql (and the POSTGRES_*
+# variables) to run on PostgreSQL instead; this needs the psycopg package.
+
+if os.environ.get('DATABASE_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'price_tracker'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            # Keep connections open between requests instead of reopening
+            # the file (and re-running the pragmas below) every time.
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, so two
+                # writers queue on busy_timeout instead of failing with
+                # "database is locked" when upgrading a read lock.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
+
+# Pragmas applied to every new SQLite connection (see products.db). WAL lets
+# readers continue while a refresh is writing, synchronous=NORMAL is safe in
+# WAL mode and avoids an fsync per commit, cache_size is in KiB when negative,
+# and busy_timeout (ms) makes writers wait for each other instead of failing.
+# Compare the settings with `manage.py benchmark_concurrency`.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'memory',
 }
 
 
+# Cache
+# Local memory by default. Set CACHE_DIR to use a file based cache instead,
+# which the web processes and the job worker share, so a finished refresh is
+# visible immediately instead of after CATALOG_VERSION_TTL seconds.
+
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'price-tracker',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -114,3 +178,95 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Scraping
+# Number of product pages fetched in parallel during a refresh and the maximum
+# number of requests per second sent to a single host.
+
+SCRAPE_MAX_WORKERS = 8
+SCRAPE_RATE_PER_HOST = 4
+
+# Timeout in seconds for a single request, and how often a failed request is
+# retried with exponential backoff (backoff factor in seconds).
+
+SCRAPE_TIMEOUT = 15
+SCRAPE_RETRIES = 3
+SCRAPE_BACKOFF = 0.5
+
+# Number of refreshed pages whose results are written in one transaction.
+
+SCRAPE_WRITE_BATCH_SIZE = 200
+
+# HTML parser backend used to extract product fields: 'soup' (full
+# BeautifulSoup tree), 'strainer', 'lxml' or 'selectolax' (needs the optional
+# selectolax package). Compare them with `manage.py benchmark_parser`.
+
+SCRAPE_PARSER = 'lxml'
+
+# Maximum number of points of the price chart on the product page; longer
+# histories are downsampled (LTTB) on the server.
+
+PRICE_CHART_POINTS = 200
+
+# Price observations are recorded explicitly, in batches, by the scraping
+# code. Set to True to also record a changed price on every Product.save(),
+# e.g. for edits in the admin; this costs extra queries per save.
+
+PRICE_HISTORY_ON_SAVE = False
+
+# Number of products per page of search results.
+
+SEARCH_RESULTS_PER_PAGE = 20
+
+# Background jobs run by `manage.py run_jobs`: a running job that did not
+# report progress for this many seconds is put back in the queue.
+
+JOB_STALE_AFTER = 600
+
+# Adaptive refresh (`manage.py refresh_due_products`): every page gets an
+# interval between the min and max (seconds) derived from how often its price
+# changed in the last REFRESH_LOOKBACK_DAYS, spread by +/- REFRESH_JITTER, and
+# all hosts together are fetched at most REFRESH_REQUESTS_PER_MINUTE times a minute.
+
+REFRESH_MIN_INTERVAL = 3600
+REFRESH_MAX_INTERVAL = 7 * 24 * 3600
+REFRESH_LOOKBACK_DAYS = 30
+REFRESH_JITTER = 0.1
+REFRESH_REQUESTS_PER_MINUTE = 60
+
+# Rendered list, detail and search pages are cached for PAGE_CACHE_TIMEOUT
+# seconds per catalog version; every write of observations or deletion bumps
+# the version. Each process rereads the version from the database at most
+# every CATALOG_VERSION_TTL seconds.
+
+PAGE_CACHE_TIMEOUT = 600
+CATALOG_VERSION_TTL = 5
+
+# JSON API: default and maximum page size of the list endpoints, and the
+# maximum number of URLs in one bulk add or delete request.
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_BULK_LIMIT = 1000
+
+# Price alerts are sent by `manage.py deliver_alerts` through the email
+# backend; a delivery that failed ALERT_MAX_ATTEMPTS times is given up.
+
+ALERT_MAX_ATTEMPTS = 5
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'price-tracker@localhost')
+
+# Sharded refresh (`manage.py run_refresh_workers`): every worker claims
+# REFRESH_CLAIM_BATCH_SIZE due pages at a time and holds them for at most
+# REFRESH_LEASE_SECONDS, after which the pages of a crashed worker are claimed again.
+
+REFRESH_CLAIM_BATCH_SIZE = 50
+REFRESH_LEASE_SECONDS = 600
+
+# Raw page archive: every fetched page whose body changed is stored compressed
+# (zstd with the optional zstandard package, gzip otherwise) and deduplicated
+# by content hash, so `manage.py reextract` can rerun the extractors offline
+# after a markup change. `manage.py prune_archive` removes old pages.
+
+PAGE_ARCHIVE = False